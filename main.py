@@ -1,7 +1,8 @@
-from utils.dropbox_filesystem import get_all_paths, sort_source_to_target
+from utils.dropbox_client import close_dropbox_clients
+from utils.dropbox_filesystem import get_all_paths, update_file_list, sort_source_to_target
 from utils.save_logs import save_file_infos, save_file_list, read_file_list, save_jsons_to_data, correct_file_infos_with_matching_metadata 
 from utils.save_logs import write_paths_file, write_general_recap_file, refresh_new_paths
-from utils.handle_duplicates import flag_same_new_paths, flag_potential_duplicates, rename_duplicates, compare_potential_duplicates, handle_duplicates_in_file_infos, regroup_actual_duplicates
+from utils.handle_duplicates import resolve_same_new_paths, flag_potential_duplicates, compare_potential_duplicates, handle_duplicates_in_file_infos, regroup_actual_duplicates
 from utils.exceptions import handle_exceptions
 from utils.misc import input_with_default
 
@@ -11,253 +12,274 @@ import os
 
 
 if __name__ == '__main__':
+    try:
 
-    subdir = input_with_default('subdir')
-    n = input_with_default('n')
+        subdir = input_with_default('subdir')
+        n = input_with_default('n')
 
-    file_list_path = 'file_list/' + subdir + '/file_list-' + n + '.json'
+        file_list_path = 'file_list/' + subdir + '/file_list-' + n + '.json'
 
-    file_infos_path = 'file_infos/'+ subdir +'/file_infos-' + n + '.json'
+        file_infos_path = 'file_infos/'+ subdir +'/file_infos-' + n + '.json'
 
-    tmpfile_infos_path = 'file_infos/'+ subdir +'/tmp_file_infos-' + n + '.json'
+        tmpfile_infos_path = 'file_infos/'+ subdir +'/tmp_file_infos-' + n + '.json'
 
-    jsons_to_data_path = 'file_infos/'+ subdir +'/jsons_to_data-' + n + '.json'
+        jsons_to_data_path = 'file_infos/'+ subdir +'/jsons_to_data-' + n + '.json'
 
-    same_new_paths_path = 'file_infos/'+ subdir +'/same_new_paths-' + n + '.json'
+        same_new_paths_path = 'file_infos/'+ subdir +'/same_new_paths-' + n + '.json'
 
-    potential_duplicates_path = 'file_infos/'+ subdir +'/potential_duplicates-' + n + '.json'
+        potential_duplicates_path = 'file_infos/'+ subdir +'/potential_duplicates-' + n + '.json'
 
-    actual_duplicates_path = 'file_infos/'+ subdir +'/actual_duplicates-' + n + '.json'
+        actual_duplicates_path = 'file_infos/'+ subdir +'/actual_duplicates-' + n + '.json'
 
-    not_downloaded_path = 'file_infos/'+ subdir +'/not_downloaded-' + n + '.json'
+        not_downloaded_path = 'file_infos/'+ subdir +'/not_downloaded-' + n + '.json'
 
-    exceptions_path = 'utils/exceptions.json'
+        exceptions_path = 'utils/exceptions.json'
 
 
-    txt_logs_path = 'paths/' + subdir + '/paths-' + n + '.txt'
+        txt_logs_path = 'paths/' + subdir + '/paths-' + n + '.txt'
 
-    tmpfiles_txt_logs_path = 'paths/' + subdir + '/tmpfiles_paths-' + n + '.txt'
+        tmpfiles_txt_logs_path = 'paths/' + subdir + '/tmpfiles_paths-' + n + '.txt'
 
-    json_recap_path = 'recaps/' + subdir + '/recap-' + n + '.json'
+        json_recap_path = 'recaps/' + subdir + '/recap-' + n + '.json'
 
+        copy_journal_path = 'file_infos/'+ subdir +'/copy_journal-' + n + '.jsonl'
 
-    old_prefix = input_with_default('old_prefix')
-    new_prefix = input_with_default('new_prefix')
 
-    sub = input_with_default('sub')
+        old_prefix = input_with_default('old_prefix')
+        new_prefix = input_with_default('new_prefix')
 
-    print('Need an access token for Dropbox')
-    ACCESS_TOKEN = input_with_default('access token')
+        sub = input_with_default('sub')
 
-    s = input("Use a preexisting file_infos.json ? [y/n]")
+        print('Need an access token for Dropbox')
+        ACCESS_TOKEN = input_with_default('access token')
 
-    saved_paths_msg = 'Path logs saved in ' + txt_logs_path + '\nAnd in ' + tmpfiles_txt_logs_path
-    saved_recap_msg = 'Recap saved in ' + json_recap_path
+        s = input("Use a preexisting file_infos.json ? [y/n]")
 
+        saved_paths_msg = 'Path logs saved in ' + txt_logs_path + '\nAnd in ' + tmpfiles_txt_logs_path
+        saved_recap_msg = 'Recap saved in ' + json_recap_path
 
-    if s=="y":
-        file_infos_path_user = input_with_default("file_infos_path")
-        tmpfile_infos_path_user = input_with_default("tmpfile_infos_path")
 
-        write_paths_file(
-            file_infos_path= file_infos_path_user,
-            out_path = txt_logs_path,
-            old_prefix=old_prefix,
-            new_prefix=new_prefix
-            )
+        if s=="y":
+            file_infos_path_user = input_with_default("file_infos_path")
+            tmpfile_infos_path_user = input_with_default("tmpfile_infos_path")
 
-        write_paths_file(
-            file_infos_path= tmpfile_infos_path_user,
-            out_path = tmpfiles_txt_logs_path,
-            old_prefix=old_prefix,
-            new_prefix=new_prefix
-            )
+            write_paths_file(
+                file_infos_path= file_infos_path_user,
+                out_path = txt_logs_path,
+                old_prefix=old_prefix,
+                new_prefix=new_prefix
+                )
+
+            write_paths_file(
+                file_infos_path= tmpfile_infos_path_user,
+                out_path = tmpfiles_txt_logs_path,
+                old_prefix=old_prefix,
+                new_prefix=new_prefix
+                )
         
-        print(saved_paths_msg)
+            print(saved_paths_msg)
         
-        write_general_recap_file(
-            file_infos_path= file_infos_path_user,
-            out_path= json_recap_path,
-            new_prefix=new_prefix
-            )
+            write_general_recap_file(
+                file_infos_path= file_infos_path_user,
+                out_path= json_recap_path,
+                new_prefix=new_prefix
+                )
         
-        print(saved_recap_msg)
+            print(saved_recap_msg)
 
-        sort_source_to_target(
-            file_infos_path= file_infos_path,
-            TOKEN=ACCESS_TOKEN
-            )
+            sort_source_to_target(
+                file_infos_path= file_infos_path,
+                TOKEN=ACCESS_TOKEN,
+                batch=True,
+                journal_path=copy_journal_path,
+                resume=True,
+                file_list_path=file_list_path
+                )
     
-    else:
-
-        s0= input("Should the files in Dropbox be read ? (can be a time-consuming step, and requires a dbx access token)\n[y/n]")
-
-        if s0 == 'y':
-            input_files = get_all_paths(TOKEN= ACCESS_TOKEN, 
-                                    dir= '/source', 
-                                    recursive=True, 
-                                    remove_source=True
-                                    )
-            print('Done reading files from Dropbox \n')
+        else:
 
-            save_file_list(input_files, file_list_path)
+            s0= input("Should the files in Dropbox be read ? (can be a time-consuming step, and requires a dbx access token)\n[y/n/u(pdate the saved list)]")
+
+            if s0 == 'y':
+                input_files, cursor, file_metadata = get_all_paths(TOKEN= ACCESS_TOKEN, 
+                                        dir= '/source', 
+                                        recursive=True, 
+                                        remove_source=True,
+                                        return_cursor=True,
+                                        return_metadata=True
+                                        )
+                print('Done reading files from Dropbox \n')
+
+                save_file_list(input_files, file_list_path, cursor, file_metadata)
+
+            elif s0 == 'u':
+                input_files = update_file_list(TOKEN= ACCESS_TOKEN,
+                                        file_list_path= file_list_path,
+                                        dir= '/source',
+                                        remove_source=True
+                                        )
+                print('Done updating the file list in ' + file_list_path + '\n')
         
-        else:
-            print('Reading file list from ' + file_list_path)
+            else:
+                print('Reading file list from ' + file_list_path)
 
-            input_files = read_file_list(file_list_path)
+                input_files = read_file_list(file_list_path)
         
-        if sub=='':
-            participants_dict = {}
-
-            try:
-                with open('./utils/participants.csv') as f:
-                    reader = csv.reader(f)
-                    for row in reader:
-                        left = row[0].strip()
-                        right = row[1].strip()
-                        if left != 'old_sub_name':
-                            participants_dict[left] = right
-            except:
-                print('participants.csv not found')
-
-            finally:    
-                save_file_infos(
-                    input_files= input_files,
-                    participants_dict= participants_dict,
-                    file_infos_path= file_infos_path,
-                    tmpfile_infos_path= tmpfile_infos_path
-                    )
+            if sub=='':
+                participants_dict = {}
+
+                try:
+                    with open('./utils/participants.csv') as f:
+                        reader = csv.reader(f)
+                        for row in reader:
+                            left = row[0].strip()
+                            right = row[1].strip()
+                            if left != 'old_sub_name':
+                                participants_dict[left] = right
+                except:
+                    print('participants.csv not found')
+
+                finally:    
+                    save_file_infos(
+                        input_files= input_files,
+                        participants_dict= participants_dict,
+                        file_infos_path= file_infos_path,
+                        tmpfile_infos_path= tmpfile_infos_path
+                        )
                 
 
-                handle_exceptions(
-                    exceptions_path= exceptions_path,
-                    file_infos_path= file_infos_path,
-                    new_file_infos_path= file_infos_path)
+                    handle_exceptions(
+                        exceptions_path= exceptions_path,
+                        file_infos_path= file_infos_path,
+                        new_file_infos_path= file_infos_path)
 
-        else:
-            save_file_infos(
-                    input_files,
-                    participants_dict={},
-                    file_infos_path= file_infos_path,
-                    tmpfile_infos_path= tmpfile_infos_path,
-                    sub=sub)
+            else:
+                save_file_infos(
+                        input_files,
+                        participants_dict={},
+                        file_infos_path= file_infos_path,
+                        tmpfile_infos_path= tmpfile_infos_path,
+                        sub=sub)
             
-            handle_exceptions(
-                    exceptions_path= exceptions_path,
-                    file_infos_path= file_infos_path,
-                    new_file_infos_path= file_infos_path)
+                handle_exceptions(
+                        exceptions_path= exceptions_path,
+                        file_infos_path= file_infos_path,
+                        new_file_infos_path= file_infos_path)
         
-        # handle duplicates    
+            # handle duplicates    
 
         
-        s = input('Compare the potential duplicates (possibly a time-consuming step, requires a dropbox access token)? [y/n/u(se previous)] \n')
+            s = input('Compare the potential duplicates (possibly a time-consuming step, requires a dropbox access token)? [y/n/u(se previous)] \n')
         
-        if s == 'y':
-            if not os.path.exists(potential_duplicates_path):
-                flag_potential_duplicates(
-                            file_infos_path=file_infos_path,
-                            flagged_path= potential_duplicates_path
-                        )
-            input('Check potential duplicates in '+ potential_duplicates_path + '\n(type enter when done to continue)')
-
-            compare_potential_duplicates(
-                flagged_path=potential_duplicates_path,
-                actual_duplicates_path=actual_duplicates_path,
-                not_downloaded_path=not_downloaded_path,
-                TOKEN= ACCESS_TOKEN,
-                verbose= True
-            )
-
-            regroup_actual_duplicates(
-                actual_duplicates_path=actual_duplicates_path,
-                new_duplicates_path=actual_duplicates_path
-            )
-
-            handle_duplicates_in_file_infos(
-                actual_duplicates_path=actual_duplicates_path,
-                file_infos_path= file_infos_path,
-                new_file_infos_path= file_infos_path
-            )
-        elif s == 'u':
-            actual_duplicates_path_user = input_with_default('actual_duplicates_path')
-
-            regroup_actual_duplicates(
-                actual_duplicates_path=actual_duplicates_path_user,
-                new_duplicates_path=actual_duplicates_path_user
-            )
-
-            handle_duplicates_in_file_infos(
-                actual_duplicates_path=actual_duplicates_path_user,
-                file_infos_path= file_infos_path,
-                new_file_infos_path= file_infos_path
-            )
-
-        s = input('Match files with their metadata (possibly a time-consuming step)? [y/n/u(se previous)] \n')
-
-        if s=='y':
-            save_jsons_to_data(
-                file_infos_path = file_infos_path,
-                jsons_to_data_path= jsons_to_data_path)
-            input('Manually correct the json in ' +jsons_to_data_path+ ' to match each json to its correct data file (type enter when done to continue)')
-
-            correct_file_infos_with_matching_metadata(
-                            file_infos_path = file_infos_path,
-                            jsons_to_data_path = jsons_to_data_path,
-                            file_infos_path = file_infos_path
-                        )
+            if s == 'y':
+                if not os.path.exists(potential_duplicates_path):
+                    flag_potential_duplicates(
+                                file_infos_path=file_infos_path,
+                                flagged_path= potential_duplicates_path
+                            )
+                input('Check potential duplicates in '+ potential_duplicates_path + '\n(type enter when done to continue)')
+
+                compare_potential_duplicates(
+                    flagged_path=potential_duplicates_path,
+                    actual_duplicates_path=actual_duplicates_path,
+                    not_downloaded_path=not_downloaded_path,
+                    TOKEN= ACCESS_TOKEN,
+                    verbose= True,
+                    file_list_path= file_list_path,
+                    method= 'content_hash'
+                )
+
+                regroup_actual_duplicates(
+                    actual_duplicates_path=actual_duplicates_path,
+                    new_duplicates_path=actual_duplicates_path
+                )
+
+                handle_duplicates_in_file_infos(
+                    actual_duplicates_path=actual_duplicates_path,
+                    file_infos_path= file_infos_path,
+                    new_file_infos_path= file_infos_path
+                )
+            elif s == 'u':
+                actual_duplicates_path_user = input_with_default('actual_duplicates_path')
+
+                regroup_actual_duplicates(
+                    actual_duplicates_path=actual_duplicates_path_user,
+                    new_duplicates_path=actual_duplicates_path_user
+                )
+
+                handle_duplicates_in_file_infos(
+                    actual_duplicates_path=actual_duplicates_path_user,
+                    file_infos_path= file_infos_path,
+                    new_file_infos_path= file_infos_path
+                )
+
+            s = input('Match files with their metadata (possibly a time-consuming step)? [y/n/u(se previous)] \n')
+
+            if s=='y':
+                save_jsons_to_data(
+                    file_infos_path = file_infos_path,
+                    jsons_to_data_path= jsons_to_data_path)
+                input('Manually correct the json in ' +jsons_to_data_path+ ' to match each json to its correct data file (type enter when done to continue)')
+
+                correct_file_infos_with_matching_metadata(
+                                file_infos_path = file_infos_path,
+                                jsons_to_data_path = jsons_to_data_path,
+                                corrected_file_infos_path = file_infos_path
+                            )
             
-        elif s == 'u':
-            jsons_to_data_path_user = input_with_default('jsons_to_data_path')
-
-            correct_file_infos_with_matching_metadata(
-                            file_infos_path = file_infos_path,
-                            jsons_to_data_path = jsons_to_data_path_user,
-                            file_infos_path = file_infos_path
-                        )
-
-        flag_same_new_paths(
-                            file_infos_path=file_infos_path,
-                            flagged_path= same_new_paths_path
-                        )
-        
-        rename_duplicates(
-                        file_infos_path,
-                        same_new_paths_path,
-                        file_infos_path
-                    )
+            elif s == 'u':
+                jsons_to_data_path_user = input_with_default('jsons_to_data_path')
+
+                correct_file_infos_with_matching_metadata(
+                                file_infos_path = file_infos_path,
+                                jsons_to_data_path = jsons_to_data_path_user,
+                                corrected_file_infos_path = file_infos_path
+                            )
+
+            resolve_same_new_paths(
+                                file_infos_path=file_infos_path,
+                                flagged_path= same_new_paths_path,
+                                new_file_infos_path= file_infos_path
+                            )
         
 
-        print('\nCheck and correct the file infos in ' + file_infos_path + ' before saving logs and copying files in Dropbox \n')
-        input('Type enter to continue')
+            print('\nCheck and correct the file infos in ' + file_infos_path + ' before saving logs and copying files in Dropbox \n')
+            input('Type enter to continue')
 
-        # Save paths.txt and recap.json
+            # Save paths.txt and recap.json
 
-        write_paths_file(
-            file_infos_path= file_infos_path,
-            out_path = txt_logs_path,
-            old_prefix=old_prefix,
-            new_prefix=new_prefix
-            )
+            write_paths_file(
+                file_infos_path= file_infos_path,
+                out_path = txt_logs_path,
+                old_prefix=old_prefix,
+                new_prefix=new_prefix
+                )
         
-        write_paths_file(
-            file_infos_path= tmpfile_infos_path,
-            out_path = tmpfiles_txt_logs_path,
-            old_prefix=old_prefix,
-            new_prefix=new_prefix
-            )
-
-        print(saved_paths_msg)
+            write_paths_file(
+                file_infos_path= tmpfile_infos_path,
+                out_path = tmpfiles_txt_logs_path,
+                old_prefix=old_prefix,
+                new_prefix=new_prefix
+                )
+
+            print(saved_paths_msg)
         
-        write_general_recap_file(
-            file_infos_path= file_infos_path,
-            out_path= json_recap_path,
-            new_prefix=new_prefix
-            )
+            write_general_recap_file(
+                file_infos_path= file_infos_path,
+                out_path= json_recap_path,
+                new_prefix=new_prefix
+                )
         
-        print(saved_recap_msg)
+            print(saved_recap_msg)
 
-        sort_source_to_target(
-            file_infos_path= file_infos_path,
-            TOKEN=ACCESS_TOKEN
-            )
\ No newline at end of file
+            sort_source_to_target(
+                file_infos_path= file_infos_path,
+                TOKEN=ACCESS_TOKEN,
+                batch=True,
+                journal_path=copy_journal_path,
+                resume=True,
+                file_list_path=file_list_path
+                )
+    finally:
+        # closes the HTTP sessions of the shared Dropbox clients
+        close_dropbox_clients()
@@ -0,0 +1,185 @@
+"""
+Local cache of the file infos computed by `utils.filename_reader.create_filename_dict`, so that running the script again
+on the same files only classifies the new ones
+
+The file infos are stored in a SQLite database, keyed by path and by a fingerprint of everything the classification depends on
+(the classification scripts, the lists of `utils/globals.py` they read, the dictionaries in `utils/*.json`, the participants dict and the kwargs):
+when one of them changes, the files are classified again, and the file infos saved with the previous fingerprint are removed
+"""
+
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+
+from utils.globals import CLASSIFICATION_CACHE_PATH, STRS_TO_IGNORE_FOR_RUN, STRS_TO_REMOVE_FOR_MODELLING_NEW_PATH
+
+# scripts whose content changes the classification, in addition to the dictionaries in utils/*.json
+CLASSIFICATION_SOURCE_FILES = ['utils/filename_reader.py', 'utils/misc.py']
+
+# lists of utils/globals.py read by the classification (the other globals, e.g. the timeouts, do not change the file infos)
+CLASSIFICATION_GLOBALS = {
+    'STRS_TO_IGNORE_FOR_RUN': STRS_TO_IGNORE_FOR_RUN,
+    'STRS_TO_REMOVE_FOR_MODELLING_NEW_PATH': STRS_TO_REMOVE_FOR_MODELLING_NEW_PATH,
+}
+
+
+def get_inputs_key(participants_dict, **kwargs):
+    """
+    Returns a fingerprint of `participants_dict` and the kwargs of `create_filename_dict` only:
+    the file infos saved with the same inputs key but another rules fingerprint are outdated (see `ClassificationCache.put_many`)
+
+    Package
+    ----
+    `utils.classification_cache.py`
+
+    Parameters
+    --------
+        participants_dict : dict,
+            new sub name given to the former one (e.g. participants_dict['REEVOID_PILOT_01'] = 'sub-pilot')
+        **kwargs
+            see `create_filename_dict`
+
+    Returns
+    --------
+        inputs_key : str,
+            sha256 hex digest
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps(participants_dict, sort_keys=True).encode())
+    h.update(json.dumps(kwargs, sort_keys=True).encode())
+    return h.hexdigest()
+
+def get_rules_fingerprint(participants_dict, **kwargs):
+    """
+    Returns a fingerprint of the inputs of `create_filename_dict`, except the path itself:
+    the classification scripts, the lists of `utils/globals.py` they read (`CLASSIFICATION_GLOBALS`),
+    the dictionaries in `utils/*.json`, `participants_dict` and the kwargs
+
+    `utils/exceptions.json` is not included, the exceptions being applied after the classification (see `utils.exceptions`)
+
+    Package
+    ----
+    `utils.classification_cache.py`
+
+    Parameters
+    --------
+        participants_dict : dict,
+            new sub name given to the former one (e.g. participants_dict['REEVOID_PILOT_01'] = 'sub-pilot')
+        **kwargs
+            see `create_filename_dict`
+
+    Returns
+    --------
+        fingerprint : str,
+            sha256 hex digest
+    """
+    rule_files = CLASSIFICATION_SOURCE_FILES + sorted(file for file in glob.glob('utils/*.json') if os.path.basename(file) != 'exceptions.json')
+    h = hashlib.sha256()
+    for file in rule_files:
+        with open(file, 'rb') as f:
+            content = f.read()
+        h.update(file.encode())
+        h.update(hashlib.sha256(content).digest())
+    h.update(json.dumps(CLASSIFICATION_GLOBALS, sort_keys=True).encode())
+    h.update(get_inputs_key(participants_dict, **kwargs).encode())
+    return h.hexdigest()
+
+class ClassificationCache:
+    """
+    File infos of the classified paths, keyed by path and rules fingerprint (see `get_rules_fingerprint`), stored in a SQLite database.
+    Only the latest fingerprint of each inputs key (see `get_inputs_key`) is kept, so that the database does not grow with each change of the rules
+
+    Package
+    ----
+    `utils.classification_cache.py`
+
+    Parameters
+    --------
+        cache_path : str, default: CLASSIFICATION_CACHE_PATH
+            path of the database (kept from one run to the next, see `utils/globals.py`)
+
+    Attributes
+    --------
+        hits, misses : int,
+            number of paths found / not found in the cache by `get_many`
+    """
+
+    def __init__(self, cache_path=CLASSIFICATION_CACHE_PATH):
+        self.cache_path = cache_path
+        self.hits = 0
+        self.misses = 0
+        dirs = os.path.dirname(cache_path)
+        if dirs:
+            os.makedirs(dirs, exist_ok=True)
+        with self.connect() as connection:
+            columns = [row[1] for row in connection.execute('PRAGMA table_info(file_infos)')]
+            if columns and 'inputs' not in columns:
+                # database of a previous version, without the inputs keys needed to remove the outdated file infos
+                connection.execute('DROP TABLE file_infos')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS file_infos '
+                '(inputs TEXT NOT NULL, fingerprint TEXT NOT NULL, path TEXT NOT NULL, infos TEXT NOT NULL, PRIMARY KEY (fingerprint, path))'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS file_infos_inputs ON file_infos (inputs)')
+
+    @contextlib.contextmanager
+    def connect(self):
+        """
+        Yields a connection to the database, committed and closed at the end of the `with` block
+        """
+        connection = sqlite3.connect(self.cache_path)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def get_many(self, paths, fingerprint):
+        """
+        Returns the cached file infos of `paths` classified with the rules `fingerprint`
+
+        Parameters
+        --------
+            paths : list(str),
+                a list of path strings
+            fingerprint : str,
+                see `get_rules_fingerprint`
+
+        Returns
+        --------
+            cached : dict,
+                cached[path] = file infos, for the paths found in the cache only
+        """
+        wanted = set(paths)
+        cached = {}
+        with self.connect() as connection:
+            for path, infos in connection.execute('SELECT path, infos FROM file_infos WHERE fingerprint = ?', (fingerprint,)):
+                if path in wanted:
+                    cached[path] = json.loads(infos)
+        self.hits += len(cached)
+        self.misses += len(wanted) - len(cached)
+        return cached
+
+    def put_many(self, file_infos, fingerprint, inputs_key):
+        """
+        Saves the file infos of several paths classified with the rules `fingerprint`,
+        and removes the file infos saved with the same `inputs_key` but other (outdated) rules
+
+        Parameters
+        --------
+            file_infos : dict,
+                file_infos[path] = file infos (see `create_filename_dict`)
+            fingerprint : str,
+                see `get_rules_fingerprint`
+            inputs_key : str,
+                see `get_inputs_key`, computed with the same participants dict and kwargs as `fingerprint`
+        """
+        with self.connect() as connection:
+            connection.execute('DELETE FROM file_infos WHERE inputs = ? AND fingerprint != ?', (inputs_key, fingerprint))
+            connection.executemany(
+                'INSERT OR REPLACE INTO file_infos (inputs, fingerprint, path, infos) VALUES (?, ?, ?, ?)',
+                [(inputs_key, fingerprint, path, json.dumps(infos)) for path, infos in file_infos.items()]
+            )
@@ -0,0 +1,291 @@
+"""
+Local cache of the files downloaded from Dropbox, so that a file appearing in several groups of potential duplicates
+(or compared again in a later run) is only downloaded once
+
+The files are stored in `cache_dir`, named after their Dropbox path and revision (a new revision of a file is a new entry).
+When the cache exceeds its byte budget, the least recently used files are removed: their sizes and order of use are kept in memory,
+the directory being only read once when the cache is opened (in the order of the modification times, updated at each use)
+"""
+
+import hashlib
+import os
+from collections import OrderedDict
+import tempfile
+import threading
+
+from utils.globals import DOWNLOAD_CACHE_DIR, DOWNLOAD_CACHE_MAX_BYTES
+
+
+def iter_response_blocks(response, block_size):
+    """
+    Yields the content of a streamed download in blocks of exactly `block_size` bytes (except for the last one)
+
+    Package
+    ----
+    `utils.download_cache.py`
+
+    Parameters
+    --------
+        response : requests.Response,
+            response returned by `dbx.files_download`
+        block_size : int,
+            size of the blocks in bytes
+    """
+    buffer = b''
+    for chunk in response.iter_content(block_size):
+        buffer += chunk
+        while len(buffer) >= block_size:
+            yield buffer[:block_size]
+            buffer = buffer[block_size:]
+    if buffer:
+        yield buffer
+
+
+def iter_download_blocks(dbx, path, block_size, rev=None):
+    """
+    Yields the content of a Dropbox file streamed in blocks of exactly `block_size` bytes (except for the last one),
+    without writing anything on the disk. The download stops when the generator is closed
+
+    Package
+    ----
+    `utils.download_cache.py`
+
+    Parameters
+    --------
+        dbx : dropbox.Dropbox,
+            authenticated Dropbox client
+        path : str,
+            Dropbox path of the file
+        block_size : int,
+            size of the blocks in bytes
+        rev : str, default: None
+            revision of the file, the latest one if None
+    """
+    _, response = dbx.files_download(path, rev=rev)
+    try:
+        yield from iter_response_blocks(response, block_size)
+    finally:
+        response.close()
+
+class DownloadCache:
+    """
+    Content of Dropbox files, keyed by path and revision, stored in a local directory with a least recently used eviction
+
+    Package
+    ----
+    `utils.download_cache.py`
+
+    Parameters
+    --------
+        cache_dir : str, default: DOWNLOAD_CACHE_DIR
+            local directory of the cache (kept from one run to the next, see `utils/globals.py`)
+        max_bytes : int, default: DOWNLOAD_CACHE_MAX_BYTES
+            disk budget of the cache in bytes, files larger than this are streamed without being cached
+
+    Attributes
+    --------
+        hits, misses : int,
+            number of reads (whole files or ranges, see `iter_blocks` and `read_ranges`) found / not found in the cache
+    """
+
+    def __init__(self, cache_dir=DOWNLOAD_CACHE_DIR, max_bytes=DOWNLOAD_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        # self._sizes[cache_path] = size in bytes, from the least to the most recently used file
+        entries = []
+        for entry in os.scandir(cache_dir):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith('.part'):
+                # download of an interrupted run, never committed
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, entry.path, stat.st_size))
+        self._sizes = OrderedDict((cache_path, size) for _, cache_path, size in sorted(entries))
+        self._total = sum(self._sizes.values())
+
+    def cache_path(self, path, rev):
+        """
+        Returns the local path of the cached content of `path` at revision `rev`
+
+        Parameters
+        --------
+            path : str,
+                Dropbox path of the file
+            rev : str,
+                revision of the file
+        """
+        key = hashlib.sha256((path.lower() + '@' + rev).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key)
+
+    def open_cached(self, path, rev):
+        """
+        Returns the cached content of `path` at revision `rev` opened in binary mode (None if it is not cached),
+        and marks it as the most recently used file
+
+        Parameters
+        --------
+            path : str,
+                Dropbox path of the file
+            rev : str,
+                revision of the file
+        """
+        cache_path = self.cache_path(path, rev)
+        try:
+            # the modification time orders the files when the cache is opened again
+            os.utime(cache_path)
+            f = open(cache_path, 'rb')
+        except FileNotFoundError:
+            # not cached, or removed by another thread in the meantime
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            if cache_path in self._sizes:
+                self._sizes.move_to_end(cache_path)
+                return f
+            # written by another process, or after the cache was opened
+            size = os.fstat(f.fileno()).st_size
+            self._sizes[cache_path] = size
+            self._total += size
+        self.evict(keep=cache_path)
+        return f
+
+    def read_ranges(self, path, rev, ranges):
+        """
+        Returns the bytes of the cached content of `path` at revision `rev` in each of the `ranges`,
+        None if it is not cached (see `open_cached`)
+
+        Parameters
+        --------
+            path : str,
+                Dropbox path of the file
+            rev : str,
+                revision of the file
+            ranges : list(tuple(int, int)),
+                (start, end) offsets of the bytes to read, `end` excluded
+        """
+        f = self.open_cached(path, rev)
+        if f is None:
+            return None
+        with f:
+            contents = []
+            for start, end in ranges:
+                f.seek(start)
+                contents.append(f.read(end - start))
+        return contents
+
+    def iter_blocks(self, dbx, path, rev, size, block_size):
+        """
+        Yields the content of `path` at revision `rev` in blocks of exactly `block_size` bytes (except for the last one),
+        read from the cache if possible, otherwise streamed from Dropbox.
+        A streamed file is added to the cache only if it is read until the end (a comparison stopping at the first different block
+        does not download the rest of the file)
+
+        Parameters
+        --------
+            dbx : dropbox.Dropbox,
+                authenticated Dropbox client
+            path : str,
+                Dropbox path of the file
+            rev : str,
+                revision of the file (from its metadata)
+            size : int,
+                size of the file in bytes
+            block_size : int,
+                size of the blocks in bytes
+        """
+        f = self.open_cached(path, rev)
+        if f is not None:
+            with f:
+                for block in iter(lambda: f.read(block_size), b''):
+                    yield block
+            return
+
+        cache_path = self.cache_path(path, rev)
+        if size > self.max_bytes:
+            yield from iter_download_blocks(dbx, path, block_size, rev)
+            return
+        # each download has its own temporary file, so that several threads can fill the cache
+        fd, part_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.part')
+        part = os.fdopen(fd, 'wb')
+        written = 0
+        try:
+            for block in iter_download_blocks(dbx, path, block_size, rev):
+                part.write(block)
+                written += len(block)
+                # the file is cached as soon as it is complete, even if the last block is not consumed
+                if written == size:
+                    self.commit(part, part_path, cache_path)
+                yield block
+            if written == size and not part.closed:
+                self.commit(part, part_path, cache_path)
+        finally:
+            if not part.closed:
+                part.close()
+                os.remove(part_path)
+
+    def commit(self, part, part_path, cache_path):
+        """
+        Moves a complete download to the cache, and removes the least recently used files if the cache is too large
+
+        Parameters
+        --------
+            part : file object,
+                temporary file of the download (closed by this method)
+            part_path : str,
+                path of the temporary file
+            cache_path : str,
+                path of the file in the cache (see `cache_path`)
+        """
+        part.close()
+        size = os.path.getsize(part_path)
+        try:
+            os.replace(part_path, cache_path)
+        except OSError:
+            # the file is being read by another thread (Windows)
+            os.remove(part_path)
+            return
+        with self._lock:
+            self._total += size - self._sizes.pop(cache_path, 0)
+            self._sizes[cache_path] = size
+        self.evict(keep=cache_path)
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used files until the cache fits in `max_bytes`
+
+        Parameters
+        --------
+            keep : str, default: None
+                local path of a cached file that should not be removed
+        """
+        with self._lock:
+            removed = []
+            # only the least recently used files are visited, not the whole cache
+            for cache_path, size in self._sizes.items():
+                if self._total <= self.max_bytes:
+                    break
+                if cache_path == keep:
+                    continue
+                try:
+                    os.remove(cache_path)
+                except FileNotFoundError:
+                    # already removed (e.g. by hand)
+                    pass
+                except OSError:
+                    # the file is being read by another thread (Windows)
+                    continue
+                removed.append(cache_path)
+                self._total -= size
+            for cache_path in removed:
+                del self._sizes[cache_path]
@@ -0,0 +1,112 @@
+import dropbox
+import sys
+import threading
+
+from dropbox.exceptions import AuthError
+
+from utils.globals import DROPBOX_MAX_CONNECTIONS
+
+# one authenticated client per access token (and timeout), shared by all the modules (and threads)
+_clients = {}
+_clients_lock = threading.Lock()
+
+# storage backend replacing the Dropbox API if set (see `set_storage_backend`)
+_storage_backend = None
+
+
+def set_storage_backend(backend):
+    """
+    Makes `get_dropbox_client` return `backend` instead of a Dropbox client, whatever the access token,
+    e.g. a `utils.local_dropbox.LocalDropbox` to run and benchmark the scripts offline.
+    `set_storage_backend(None)` goes back to the Dropbox API
+
+    Package
+    ----
+    `utils.dropbox_client.py`
+
+    Parameters
+    --------
+        backend : object,
+            implements the methods of `dropbox.Dropbox` used in `utils` (see `utils/local_dropbox.py`), or None
+    """
+    global _storage_backend
+    _storage_backend = backend
+
+
+def get_dropbox_client(TOKEN, verbose=True, timeout=None):
+    """
+    Returns the Dropbox client for `TOKEN`, creating it on the first call
+    (or the storage backend set by `set_storage_backend`)
+
+    The access token is only validated once (when the client is created), then the same client is returned
+    to every caller. Its HTTP session keeps up to `DROPBOX_MAX_CONNECTIONS` connections alive (see `utils/globals.py`),
+    so that concurrent workers reuse them instead of opening a new TLS connection for every request.
+    This function can be called from several threads
+
+    The requests time out after the default delay of the SDK (100s), unless `timeout` is specified:
+    a copy of the client with this timeout is then returned, sharing the same HTTP session
+    (used for uploads and downloads, see `DROPBOX_TRANSFER_TIMEOUT` in `utils/globals.py`)
+
+    **Exits if the access token is empty or invalid**
+
+    Package
+    ----
+    `utils.dropbox_client.py`
+
+    Parameters
+    --------
+        TOKEN : str,
+            access token for the Dropbox API
+        verbose=True : bool,
+            prints infos on Dropbox authentication if set to True (only when the client is created)
+        timeout=None : int,
+            timeout of the requests in seconds, the default one of the SDK if None
+
+    Returns
+    --------
+        dbx : dropbox.Dropbox,
+            authenticated Dropbox client
+    """
+    if _storage_backend is not None:
+        return _storage_backend
+
+    if (len(TOKEN) == 0):
+        sys.exit("ERROR: Looks like you didn't add your access token.")
+
+    with _clients_lock:
+        if (TOKEN, None) not in _clients:
+            # Create an instance of a Dropbox class, which can make requests to the API.
+            if verbose:
+                print("Creating a Dropbox object...")
+            session = dropbox.create_session(max_connections=DROPBOX_MAX_CONNECTIONS)
+            dbx = dropbox.Dropbox(TOKEN, session=session)
+
+            # Check that the access token is valid
+            try:
+                dbx.users_get_current_account()
+                if verbose:
+                    print('Access token is valid')
+            except AuthError:
+                sys.exit("ERROR: Invalid access token; try re-generating an "
+                    "access token from the app console on the web.")
+            _clients[(TOKEN, None)] = dbx
+        if (TOKEN, timeout) not in _clients:
+            _clients[(TOKEN, timeout)] = _clients[(TOKEN, None)].clone(timeout=timeout)
+        return _clients[(TOKEN, timeout)]
+
+
+def close_dropbox_clients():
+    """
+    Closes the HTTP sessions of all the clients created by `get_dropbox_client`,
+    the next call to `get_dropbox_client` will create (and validate) a new client
+
+    Package
+    ----
+    `utils.dropbox_client.py`
+    """
+    with _clients_lock:
+        # the copies with another timeout share the session of their original client
+        for (TOKEN, timeout), dbx in _clients.items():
+            if timeout is None:
+                dbx.close()
+        _clients.clear()
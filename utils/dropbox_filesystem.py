@@ -1,22 +1,306 @@
 import dropbox
 import json
-import numpy as np
-import sys
+import os
+import time
+
+from bisect import bisect_left, insort
+from concurrent.futures import ThreadPoolExecutor
 
 from dropbox.files import WriteMode
-from dropbox.exceptions import ApiError, AuthError
+from dropbox.exceptions import ApiError
 
 from tqdm import tqdm
 
+from utils.dropbox_client import get_dropbox_client
 from utils.globals import STOP_FLAGS, EXACT_STOP_FLAGS
+from utils.save_logs import save_file_list, read_file_metadata
 
 
-    
-    
-def get_all_paths(TOKEN, dir='/source', recursive = True, remove_source = True, exceptions=True, verbose = True):
+def is_stop_flagged(folder_path):
+    """
+    Returns True iff the folder should not be explored, i.e. its path contains one of the `STOP_FLAGS`
+    or its name is one of the `EXACT_STOP_FLAGS` (see `utils/globals.py`)
+
+    Package
+    ----
+    `utils.dropbox_filesystem.py`
+
+    Parameters
+    --------
+        folder_path : str,
+            path to a Dropbox folder
+
+    Returns
+    --------
+        is_stop_flagged_bool : bool,
+    """
+    folder_path_lower = folder_path.lower()
+    last_folder = folder_path_lower.split('/')[-1]
+    return any(stop_flag in folder_path_lower for stop_flag in STOP_FLAGS) or last_folder in EXACT_STOP_FLAGS
+
+
+def remove_source_prefix(path):
+    """
+    Removes '/source' at the beginning of a Dropbox path, the returned path always starts with '/'
+
+    Package
+    ----
+    `utils.dropbox_filesystem.py`
+    """
+    new_path = path[len('/source'):]
+    if len(new_path) == 0 or new_path[0] != '/':
+        new_path = '/' + new_path
+    return new_path
+
+
+def list_folder_entries(dbx, dir, recursive=False, limit=None, cursor=None, listing_state=None):
+    """
+    Yields the metadata of all entries in a Dropbox folder, following the listing cursor until `has_more` is False
+
+    Package
+    ----
+    `utils.dropbox_filesystem.py`
+
+    Parameters
+    --------
+        dbx : dropbox.Dropbox,
+            authenticated Dropbox client
+        dir : str,
+            path to the Dropbox folder
+        recursive=False : bool,
+            lists the contents of all the subfolders in the same listing if set to True
+        limit=None : int,
+            approximate maximal number of entries per page (at most 2000, Dropbox default otherwise)
+        cursor=None : str,
+            cursor returned by a previous listing of `dir`; if specified, only the changes since
+            that listing are yielded (including `dropbox.files.DeletedMetadata` entries)
+        listing_state=None : dict,
+            if specified, `listing_state['cursor']` is set to the latest cursor once the listing is complete
+
+    Yields
+    --------
+        entry : dropbox.files.Metadata,
+            file or folder metadata, in the order returned by Dropbox
+    """
+    if cursor is None:
+        result = dbx.files_list_folder(dir, recursive=recursive, limit=limit)
+    else:
+        result = dbx.files_list_folder_continue(cursor)
+    while True:
+        for entry in result.entries:
+            yield entry
+        if not result.has_more:
+            break
+        result = dbx.files_list_folder_continue(result.cursor)
+    if listing_state is not None:
+        listing_state['cursor'] = result.cursor
+
+
+def filter_source_entries(entries, dir='/source', exceptions=True):
+    """
+    Yields the entries of a recursive listing of `dir` that `get_all_paths` keeps
+
+    Subtrees of stop flagged folders (see `is_stop_flagged`) are pruned on the client side:
+    the stop flagged folder is yielded, but none of its contents.
+    Other folders are not yielded, `dropbox.files.DeletedMetadata` entries are always yielded
+
+    Package
+    ----
+    `utils.dropbox_filesystem.py`
+
+    Parameters
+    --------
+        entries : iterable(dropbox.files.Metadata),
+            entries of a recursive listing of `dir` (see `list_folder_entries`)
+        dir='/source' : str,
+            path to the listed directory
+        exceptions=True : bool,
+            does not keep the contents of directories containing stop flags if set to True
+
+    Yields
+    --------
+        entry : dropbox.files.Metadata,
+            metadata of a file, of a stop flagged folder, or of a deleted entry
+    """
+    root = dir.rstrip('/').lower()
+
+    # blocked[folder] is True iff the folder or one of its parents (below `dir`) is stop flagged
+    blocked = {root: False}
+
+    def is_blocked(folder_path):
+        key = folder_path.lower()
+        if key not in blocked:
+            parent = folder_path.rsplit('/', 1)[0]
+            if len(parent) <= len(root):
+                blocked[key] = exceptions and is_stop_flagged(folder_path)
+            else:
+                blocked[key] = is_blocked(parent) or (exceptions and is_stop_flagged(folder_path))
+        return blocked[key]
+
+    for entry in entries:
+        if isinstance(entry, dropbox.files.DeletedMetadata):
+            yield entry
+            continue
+        path = entry.path_display
+        if entry.path_lower == root:
+            continue
+        parent = path.rsplit('/', 1)[0]
+        if len(parent) > len(root) and is_blocked(parent):
+            continue
+        if isinstance(entry, dropbox.files.FolderMetadata):
+            if is_blocked(path):
+                yield entry
+        else:
+            yield entry
+
+
+def iter_source_entries(dbx, dir='/source', recursive=True, exceptions=True, listing_state=None, workers=None):
+    """
+    Yields the entries that `get_all_paths` keeps, using a single recursive listing of `dir` (see `filter_source_entries`),
+    or a concurrent walk through its folders if `workers` is specified (see `walk_source_entries`)
+
+    Package
+    ----
+    `utils.dropbox_filesystem.py`
+
+    Parameters
+    --------
+        dbx : dropbox.Dropbox,
+            authenticated Dropbox client
+        dir='/source' : str,
+            path to the specified directory
+        recursive=True : bool,
+            yields all the files in the subdirectories if set to True,
+            yields the direct files and subdirs of `dir` otherwise
+        exceptions=True : bool,
+            does not explore directories containing stop flags if set to True
+        listing_state=None : dict,
+            see `list_folder_entries` (not used with `workers`)
+        workers=None : int,
+            see `walk_source_entries`
+
+    Yields
+    --------
+        entry : dropbox.files.Metadata,
+            metadata of a file, or of a stop flagged folder
+    """
+    dir = dir.rstrip('/')
+
+    if recursive and workers is not None:
+        for entry in walk_source_entries(dbx, dir, exceptions, workers):
+            yield entry
+        return
+
+    if not recursive:
+        for entry in list_folder_entries(dbx, dir, listing_state=listing_state):
+            yield entry
+        return
+
+    entries = list_folder_entries(dbx, dir, recursive=True, listing_state=listing_state)
+    for entry in filter_source_entries(entries, dir, exceptions):
+        yield entry
+
+
+def walk_source_entries(dbx, dir='/source', exceptions=True, workers=8):
+    """
+    Yields the same entries as `iter_source_entries`, in the order of a depth-first walk,
+    listing each folder separately (for the folders that cannot be listed recursively)
+
+    Sibling folders are listed concurrently by a pool of `workers` threads: as soon as a folder is listed,
+    its subfolders that are not stop flagged are submitted to the pool.
+    The entries are still yielded in the same order as the sequential walk
+
+    Package
+    ----
+    `utils.dropbox_filesystem.py`
+
+    Parameters
+    --------
+        dbx : dropbox.Dropbox,
+            authenticated Dropbox client (shared by the threads)
+        dir='/source' : str,
+            path to the specified directory
+        exceptions=True : bool,
+            does not explore directories containing stop flags if set to True
+        workers=8 : int,
+            maximal number of folder listings in flight, `workers=1` is the sequential walk
+
+    Yields
+    --------
+        entry : dropbox.files.Metadata,
+            metadata of a file, or of a stop flagged folder
+    """
+    dir = dir.rstrip('/')
+
+    def is_explored(entry):
+        return isinstance(entry, dropbox.files.FolderMetadata) and not (exceptions and is_stop_flagged(entry.path_display))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+
+        def list_folder(folder_path):
+            entries = list(list_folder_entries(dbx, folder_path))
+            subfolders = {
+                entry.path_lower: executor.submit(list_folder, entry.path_display)
+                for entry in entries if is_explored(entry)
+            }
+            return entries, subfolders
+
+        def walk(future):
+            entries, subfolders = future.result()
+            for entry in entries:
+                if is_explored(entry):
+                    yield from walk(subfolders[entry.path_lower])
+                else:
+                    yield entry
+
+        try:
+            yield from walk(executor.submit(list_folder, dir))
+        finally:
+            # stops the remaining listings if the walk is interrupted
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+def entry_metadata(entry):
+    """
+    Returns a compact record of the metadata of a listed entry, as saved in the file list (see `utils.save_logs.save_file_list`)
+
+    Package
+    ----
+    `utils.dropbox_filesystem.py`
+
+    Parameters
+    --------
+        entry : dropbox.files.Metadata,
+            file or folder metadata
+
+    Returns
+    --------
+        record : dict,
+            `{"kind": "folder"}` for folders, and for files:
+            `{"kind": "file", "size": int, "content_hash": str, "rev": str, "server_modified": str (ISO 8601)}`
+    """
+    if isinstance(entry, dropbox.files.FileMetadata):
+        return {
+            "kind": "file",
+            "size": entry.size,
+            "content_hash": entry.content_hash,
+            "rev": entry.rev,
+            "server_modified": entry.server_modified.isoformat()
+        }
+    elif isinstance(entry, dropbox.files.FolderMetadata):
+        return {"kind": "folder"}
+    else:
+        return {"kind": "deleted"}
+
+
+def get_all_paths(TOKEN, dir='/source', recursive = True, remove_source = True, exceptions=True, verbose = True, return_cursor=False, workers=None, return_metadata=False):
     """
     Returns all file paths within a specified directory in dropbox
 
+    By default, the whole directory is read with one recursive listing (paginated with the listing cursor),
+    stop flagged subdirectories are pruned locally (see `filter_source_entries`).
+    If `workers` is specified, each folder is listed separately by a pool of threads instead (see `walk_source_entries`)
+
     Package
     ----
     `utils.dropbox_filesystem.py`
@@ -38,66 +322,376 @@ def get_all_paths(TOKEN, dir='/source', recursive = True, remove_source = True,
             does not explore directories containing stop flags if set to True
         verbose=True : bool,
             prints infos on Dropbox authentication if set to True
+        return_cursor=False : bool,
+            also returns the listing cursor if set to True (see `update_file_list`),
+            not available with `workers` (raises a ValueError)
+        workers=None : int,
+            if specified, folders are listed one by one, with at most `workers` listings in flight
+            (useful when a recursive listing is not possible, e.g. for shared folders)
+        return_metadata=False : bool,
+            also returns the metadata of the listed entries if set to True
         
     
     Returns
     --------
         all_paths : list(str),
             a list of all file paths in the specified Dropbox directory
+        cursor : str,
+            only if `return_cursor` is True, cursor of the listing
+        file_metadata : dict,
+            only if `return_metadata` is True, file_metadata[path] is the record returned by `entry_metadata`
+            (size, content_hash, rev, ...) for each path in `all_paths`
     """
-    if (len(TOKEN) == 0):
-        sys.exit("ERROR: Looks like you didn't add your access token.")
+    if return_cursor and workers is not None:
+        # the folders are listed separately, there is no cursor for the whole listing
+        raise ValueError('return_cursor=True is not available with workers')
 
-        # Create an instance of a Dropbox class, which can make requests to the API.
-    if verbose: 
-        print("Creating a Dropbox object...")
-    with dropbox.Dropbox(TOKEN) as dbx:
+    dbx = get_dropbox_client(TOKEN, verbose)
 
-        # Check that the access token is valid
-        try:
-            dbx.users_get_current_account()
-            if verbose:
-                print('Access token is valid')
-        except AuthError:
-            sys.exit("ERROR: Invalid access token; try re-generating an "
-                "access token from the app console on the web.")
-            
+    listing_state = {}
     all_paths = []
+    file_metadata = {}
+    for entry in iter_source_entries(dbx, dir, recursive, exceptions, listing_state, workers):
+        if remove_source:
+            path = remove_source_prefix(entry.path_display)
+        else:
+            path = entry.path_display
+        all_paths.append(path)
+        if return_metadata:
+            file_metadata[path] = entry_metadata(entry)
 
-    for entry in dbx.files_list_folder(dir).entries:
-        last_folder = (entry.path_display).split('/')[-1].lower()
-        if recursive:  
-            if type(entry) == dropbox.files.FolderMetadata:
-                if exceptions and (np.array([stop_flag in entry.path_display.lower() for stop_flag in STOP_FLAGS]).any() or last_folder in EXACT_STOP_FLAGS ):
-                    if remove_source:
-                        new_path = entry.path_display[len('/source'):]
-                        if new_path[0] != '/':
-                            new_path = '/' + new_path
-                        all_paths.append(new_path)
-                    else:
-                        all_paths.append(entry.path_display)
-                else:
-                    all_paths += get_all_paths(TOKEN, entry.path_display, recursive, remove_source, exceptions, verbose=False)
+    if not (return_cursor or return_metadata):
+        return all_paths
+    to_return = [all_paths]
+    if return_cursor:
+        to_return.append(listing_state['cursor'])
+    if return_metadata:
+        to_return.append(file_metadata)
+    return tuple(to_return)
+
+
+def update_file_list(TOKEN, file_list_path, dir='/source', remove_source=True, exceptions=True, verbose=True):
+    """
+    Updates the file list saved in `file_list_path` with the changes made in `dir` since it was listed,
+    using the cursor saved by `save_file_list`
+
+    Only the added and deleted entries are read from Dropbox; if the saved cursor is missing or
+    has been reset by Dropbox, `dir` is listed again entirely
 
+    **Overwrites the file in `file_list_path`**
+
+    Package
+    ----
+    `utils.dropbox_filesystem.py`
+
+    Parameters
+    --------
+        TOKEN : str,
+            access token for the Dropbox API
+        file_list_path : str,
+            path to a file list saved by `save_file_list` (usually of the type `/file_list/subdir/file_list-[n].json`)
+        dir='/source' : str,
+            directory that was listed to create the file list
+        remove_source=True : bool,
+            should be the same value as for the original listing
+        exceptions=True : bool,
+            should be the same value as for the original listing
+        verbose=True : bool,
+            prints infos on Dropbox authentication and on the changes if set to True
+
+    Returns
+    --------
+        input_files : list(str),
+            the updated file list
+
+    Saves
+    --------
+        file_list_path, json file
+            updated file list, cursor and file metadata
+    """
+    with open(file_list_path, 'r') as f:
+        data = json.load(f)
+    cursor = data.get('cursor')
+
+    if cursor is None:
+        if verbose:
+            print('No cursor saved in ' + file_list_path + ', reading all the files')
+        input_files, cursor, file_metadata = get_all_paths(TOKEN, dir, True, remove_source, exceptions, verbose, return_cursor=True, return_metadata=True)
+        save_file_list(input_files, file_list_path, cursor, file_metadata)
+        return input_files
+
+    dbx = get_dropbox_client(TOKEN, verbose)
+
+    listing_state = {}
+    try:
+        changes = list(filter_source_entries(
+            list_folder_entries(dbx, dir, cursor=cursor, listing_state=listing_state),
+            dir,
+            exceptions
+        ))
+    except ApiError as e:
+        if not (isinstance(e.error, dropbox.files.ListFolderContinueError) and e.error.is_reset()):
+            raise
+        if verbose:
+            print('The saved cursor was reset by Dropbox, reading all the files')
+        input_files, cursor, file_metadata = get_all_paths(TOKEN, dir, True, remove_source, exceptions, verbose, return_cursor=True, return_metadata=True)
+        save_file_list(input_files, file_list_path, cursor, file_metadata)
+        return input_files
+
+    # Dropbox paths are case insensitive
+    files = {file.lower(): file for file in data['input_files']}
+    # sorted keys of files, so that the contents of a deleted folder are found by bisection
+    sorted_files = sorted(files)
+    file_metadata = data.get('file_metadata', {})
+    n_added = 0
+    n_deleted = 0
+    for entry in changes:
+        if remove_source:
+            path = remove_source_prefix(entry.path_display)
+        else:
+            path = entry.path_display
+        path_lower = path.lower()
+        if isinstance(entry, dropbox.files.DeletedMetadata):
+            if path_lower in files:
+                file_metadata.pop(files.pop(path_lower), None)
+                del sorted_files[bisect_left(sorted_files, path_lower)]
+                n_deleted += 1
             else:
-                if remove_source:
-                    new_path = entry.path_display[len('/source'):]
-                    if new_path[0] != '/':
-                        new_path = '/' + new_path
-                    all_paths.append(new_path)
-                else:
-                    all_paths.append(entry.path_display)
+                # deleted folder: its contents (the keys between path_lower + '/' and path_lower + '0', '0' following '/') are removed too
+                start = bisect_left(sorted_files, path_lower + '/')
+                end = bisect_left(sorted_files, path_lower + '0', start)
+                for file_lower in sorted_files[start:end]:
+                    file_metadata.pop(files.pop(file_lower), None)
+                del sorted_files[start:end]
+                n_deleted += end - start
         else:
-            if remove_source:
-                new_path = entry.path_display[len('/source'):]
-                if new_path[0] != '/':
-                    new_path = '/' + new_path
-                all_paths.append(new_path)
+            if path_lower not in files:
+                files[path_lower] = path
+                insort(sorted_files, path_lower)
+                n_added += 1
+            # modified files are listed again with their new metadata
+            file_metadata[files[path_lower]] = entry_metadata(entry)
+
+    input_files = list(files.values())
+    if verbose:
+        print(str(n_added) + ' added and ' + str(n_deleted) + ' deleted paths since the last listing')
+    save_file_list(input_files, file_list_path, listing_state['cursor'], file_metadata)
+    return input_files
+
+def get_relocation_paths(file_info, source_dir='/source', target_dir='/target/'):
+    """
+    Returns the Dropbox paths from which and to which a file is copied by `sort_source_to_target`
+
+    Package
+    ----
+    `utils.dropbox_filesystem.py`
+
+    Parameters
+    ----
+        file_info: dict,
+            the file infos of a file (see `utils.filename_reader.create_filename_dict`)
+        source_dir='/source': str,
+            see `sort_source_to_target`
+        target_dir='/target/': str,
+            see `sort_source_to_target`
+
+    Returns
+    ----
+        from_path: str,
+        to_path: str,
+    """
+    if source_dir[-1] == '/' and file_info["old_path"][0] =='/':
+        correct_source_dir = source_dir[:-1]
+    elif source_dir[-1] != '/' and file_info["old_path"][0] =='/':
+        correct_source_dir = source_dir
+    elif source_dir[-1] == '/' and file_info["old_path"][0]!='/':
+        correct_source_dir = source_dir
+    elif source_dir[-1] != '/' and file_info["old_path"][0]!='/':
+        correct_source_dir = source_dir + '/'
+    
+    if target_dir[-1] == '/' and file_info["new_path"]=='/':
+        correct_target_dir = target_dir[:-1]
+    elif target_dir[-1] != '/' and file_info["new_path"]=='/':
+        correct_target_dir = target_dir
+    elif target_dir[-1] == '/' and file_info["new_path"]!='/':
+        correct_target_dir = target_dir
+    elif target_dir[-1] != '/' and file_info["new_path"]!='/':
+        correct_target_dir = target_dir + '/'
+    
+    from_path = correct_source_dir + file_info["old_path"]
+    to_path = correct_target_dir + file_info["new_path"]
+    return from_path, to_path
+
+
+def copy_batch(dbx, relocations, batch_size=1000, poll_interval=1, max_retries=3, verbose=True, on_copied=None):
+    """
+    Copies files in Dropbox with `files_copy_batch_v2` jobs of at most `batch_size` entries
+
+    All the jobs are launched first, then their status is polled until they are all complete.
+    Entries failing because of too many write operations are retried in new jobs (at most `max_retries` times)
+
+    Package
+    ----
+    `utils.dropbox_filesystem.py`
+
+    Parameters
+    ----
+        dbx : dropbox.Dropbox,
+            authenticated Dropbox client
+        relocations : list(tuple(str, str)),
+            (from_path, to_path) for each file to copy
+        batch_size=1000 : int,
+            number of entries per job (at most 1000)
+        poll_interval=1 : float,
+            time (in seconds) between two checks of the jobs status
+        max_retries=3 : int,
+            maximal number of retries for the entries failing with `too_many_write_operations`
+        verbose=True : bool,
+            shows a progress bar if set to True
+        on_copied=None : function,
+            if specified, `on_copied(index)` is called as soon as the relocation `relocations[index]` is known to be done
+
+    Returns
+    ----
+        failures : dict,
+            failures[index] = error for the relocations (indexed as in `relocations`) that could not be copied
+    """
+    failures = {}
+    to_copy = list(range(len(relocations)))
+    pbar = tqdm(total=len(relocations), disable=not verbose)
+
+    for retry in range(max_retries + 1):
+        jobs = []
+        for start in range(0, len(to_copy), batch_size):
+            indices = to_copy[start:start + batch_size]
+            entries = [dropbox.files.RelocationPath(from_path=relocations[i][0], to_path=relocations[i][1]) for i in indices]
+            try:
+                launch = dbx.files_copy_batch_v2(entries, autorename=False)
+            except ApiError as e:
+                for i in indices:
+                    failures[i] = e
+                pbar.update(len(indices))
+                continue
+            if launch.is_complete():
+                jobs.append((indices, None, launch.get_complete()))
             else:
-                all_paths.append(entry.path_display)
-    return all_paths
+                jobs.append((indices, launch.get_async_job_id(), None))
+
+        to_retry = []
+        while len(jobs) > 0:
+            in_progress = []
+            for indices, async_job_id, result in jobs:
+                if result is None:
+                    try:
+                        status = dbx.files_copy_batch_check_v2(async_job_id)
+                    except ApiError as e:
+                        for i in indices:
+                            failures[i] = e
+                        pbar.update(len(indices))
+                        continue
+                    if status.is_in_progress():
+                        in_progress.append((indices, async_job_id, None))
+                        continue
+                    result = status.get_complete()
+
+                # the result entries are in the same order as the submitted entries
+                for i, entry in zip(indices, result.entries):
+                    if entry.is_failure():
+                        error = entry.get_failure()
+                        if error.is_too_many_write_operations() and retry < max_retries:
+                            to_retry.append(i)
+                            continue
+                        failures[i] = error
+                    elif not entry.is_success():
+                        # unknown result (e.g. `other`), the file may not have been copied
+                        failures[i] = entry
+                    elif on_copied is not None:
+                        on_copied(i)
+                    pbar.update(1)
+            jobs = in_progress
+            if len(jobs) > 0:
+                time.sleep(poll_interval)
+
+        if len(to_retry) == 0:
+            break
+        to_copy = to_retry
+        time.sleep(poll_interval)
+
+    pbar.close()
+    return failures
+
+
+def read_copy_journal(journal_path):
+    """
+    Returns the relocations recorded in a copy journal (see `sort_source_to_target`)
+
+    Package
+    ----
+    `utils.dropbox_filesystem.py`
+
+    Parameters
+    ----
+        journal_path: str,
+            path to the journal, each line is a json `{"from_path": ..., "to_path": ...}`
+
+    Returns
+    ----
+        copied: dict,
+            copied[to_path.lower()] = from_path for each recorded relocation, empty if there is no journal
+    """
+    copied = {}
+    try:
+        with open(journal_path, 'r') as f:
+            for line in f:
+                try:
+                    relocation = json.loads(line)
+                except json.JSONDecodeError:
+                    # last line of an interrupted run
+                    continue
+                copied[relocation["to_path"].lower()] = relocation["from_path"]
+    except FileNotFoundError:
+        pass
+    return copied
+
+
+def is_copy_of(dbx, target_entry, from_path, record):
+    """
+    Returns True if the file `target_entry` found in the target directory has the size and the content hash of the source file `from_path`,
+    i.e. if it can be recorded as copied from it by `sort_source_to_target`
 
-def sort_source_to_target(file_infos_path, TOKEN, source_dir='/source', target_dir='/target/'):
+    Package
+    ----
+    `utils.dropbox_filesystem.py`
+
+    Parameters
+    ----
+        dbx: dropbox.Dropbox,
+            authenticated Dropbox client
+        target_entry: dropbox.files.Metadata,
+            metadata of the file in the target directory (from its listing)
+        from_path: str,
+            Dropbox path of the source file
+        record: dict,
+            metadata of the source file saved with the file list (see `entry_metadata`), requested to Dropbox if incomplete
+
+    Returns
+    ----
+        bool
+    """
+    if not isinstance(target_entry, dropbox.files.FileMetadata):
+        return False
+    if record.get('size') is None or record.get('content_hash') is None:
+        try:
+            metadata = dbx.files_get_metadata(from_path)
+        except ApiError:
+            return False
+        if not isinstance(metadata, dropbox.files.FileMetadata):
+            return False
+        record = {'size': metadata.size, 'content_hash': metadata.content_hash}
+    return target_entry.size == record['size'] and target_entry.content_hash == record['content_hash']
+
+
+def sort_source_to_target(file_infos_path, TOKEN, source_dir='/source', target_dir='/target/', batch=False, batch_size=1000, journal_path=None, resume=False, file_list_path=None):
     """
     Sorts the files from `source_dir` and copies them to `target_dir` in the DropBox, 
     following the instructions in `file_infos_path`
@@ -123,65 +717,130 @@ def sort_source_to_target(file_infos_path, TOKEN, source_dir='/source', target_d
         target_dir='/target/': str, 
             path to the specified target directory (should start with '/target'), 
             target_dir='/target/dir' and target_dir='/target/dir/' will return the same result
+        batch=False: bool,
+            copies the files with batch jobs (see `copy_batch`) if set to True, one by one otherwise
+        batch_size=1000: int,
+            number of files per batch job (at most 1000)
+        journal_path=None: str,
+            if specified, each completed copy is appended to this journal (one json line per file),
+            so that an interrupted run (e.g. expired access token) can be resumed
+        resume=False: bool,
+            skips the files already copied if set to True: the files recorded in the journal and found in the target directory
+            (read with one recursive listing of `target_dir`), and the files found in the target directory with the size and the content hash
+            of their source file (copied by a run that could not record them). The files recorded in the journal but missing from the target
+            directory (e.g. deleted since) are copied again, the other files found in the target directory are left as transfer errors
+        file_list_path=None: str,
+            file list saved with the metadata of the source files (see `utils.save_logs.save_file_list`), used by `resume`
+            to compare the files found in the target directory with their source file (requested to Dropbox otherwise)
     
     Modifies the target directory in Dropbox
     ----
-    """
-    if (len(TOKEN) == 0):
-        sys.exit("ERROR: Looks like you didn't add your access token.")
 
-        # Create an instance of a Dropbox class, which can make requests to the API.
-    print("Creating a Dropbox object...")
-    with dropbox.Dropbox(TOKEN) as dbx:
-        # Check that the access token is valid
-        try:
-            dbx.users_get_current_account()
-            print("Access token is valid")
-        except AuthError:
-            sys.exit("ERROR: Invalid access token; try re-generating an "
-                "access token from the app console on the web.")
+    Saves
+    ----
+        journal_path, json lines file
+            appends the completed copies
+    """
+    dbx = get_dropbox_client(TOKEN)
             
     with open(file_infos_path, 'r') as f:
         file_infos = json.load(f)
 
     errors = {}
 
-    for file in tqdm(file_infos.keys()):
-        if source_dir[-1] == '/' and file_infos[file]["old_path"][0] =='/':
-            correct_source_dir = source_dir[:-1]
-        elif source_dir[-1] != '/' and file_infos[file]["old_path"][0] =='/':
-            correct_source_dir = source_dir
-        elif source_dir[-1] == '/' and file_infos[file]["old_path"][0]!='/':
-            correct_source_dir = source_dir
-        elif source_dir[-1] != '/' and file_infos[file]["old_path"][0]!='/':
-            correct_source_dir = source_dir + '/'
-        
-        if target_dir[-1] == '/' and file_infos[file]["new_path"]=='/':
-            correct_target_dir = target_dir[:-1]
-        elif target_dir[-1] != '/' and file_infos[file]["new_path"]=='/':
-            correct_target_dir = target_dir
-        elif target_dir[-1] == '/' and file_infos[file]["new_path"]!='/':
-            correct_target_dir = target_dir
-        elif target_dir[-1] != '/' and file_infos[file]["new_path"]!='/':
-            correct_target_dir = target_dir + '/'
-        
-        from_path = correct_source_dir + file_infos[file]["old_path"]
-        to_path = correct_target_dir + file_infos[file]["new_path"]
-        #print('Copying from: \n', from_path)
-        #print('to: \n', to_path)
+    relocations = []
+    # old path (as in the file list) of each source file
+    old_paths = {}
+    for file in file_infos.keys():
         try:
             confirmed_duplicate = file_infos[file]["confirmed_duplicate"]
         except:
             confirmed_duplicate = False
         if not confirmed_duplicate:
+            from_path, to_path = get_relocation_paths(file_infos[file], source_dir, target_dir)
+            relocations.append((from_path, to_path))
+            old_paths[from_path] = file_infos[file]["old_path"]
 
-            try:
-                dbx.files_copy(
-                    from_path= from_path,
-                    to_path= to_path
-                )
-            except:
+    journal = None
+    if journal_path is not None:
+        journal_dirs = '/'.join(journal_path.split('/')[:-1])
+        if journal_dirs != '':
+            os.makedirs(journal_dirs, exist_ok=True)
+        journal = open(journal_path, 'a+')
+        journal.seek(0, os.SEEK_END)
+        if journal.tell() > 0:
+            journal.seek(journal.tell() - 1)
+            if journal.read(1) != '\n':
+                # last line of an interrupted run
+                journal.write('\n')
+
+    def record_copy(from_path, to_path):
+        if journal is not None:
+            journal.write(json.dumps({"from_path": from_path, "to_path": to_path}) + '\n')
+            journal.flush()
+
+    if resume:
+        copied = {}
+        if journal_path is not None:
+            copied = read_copy_journal(journal_path)
+        file_metadata = {}
+        if file_list_path is not None:
+            file_metadata = read_file_metadata(file_list_path)
+        try:
+            target_files = {entry.path_lower: entry for entry in list_folder_entries(dbx, target_dir.rstrip('/'), recursive=True)}
+        except ApiError as e:
+            if not (isinstance(e.error, dropbox.files.ListFolderError) and e.error.is_path() and e.error.get_path().is_not_found()):
+                raise
+            # the target directory does not exist yet
+            target_files = {}
+        # the listing of the target directory decides what is left to copy, the journal may be outdated
+        remaining_relocations = []
+        n_missing = 0
+        n_skipped = 0
+        for from_path, to_path in relocations:
+            target_entry = target_files.get(to_path.lower())
+            if target_entry is None:
+                if to_path.lower() in copied:
+                    n_missing += 1
+                remaining_relocations.append((from_path, to_path))
+            elif copied.get(to_path.lower()) == from_path:
+                n_skipped += 1
+            elif is_copy_of(dbx, target_entry, from_path, file_metadata.get(old_paths[from_path], {})):
+                # copied by a previous run that could not record it
+                record_copy(from_path, to_path)
+                n_skipped += 1
+            else:
+                # another file is already at this path (e.g. two source files with the same new path)
                 errors[from_path] = to_path
+        print(str(n_skipped) + ' files already copied in target directory')
+        if n_missing > 0:
+            print(str(n_missing) + ' files recorded in ' + journal_path + ' are missing from the target directory, they will be copied again')
+        if len(errors) > 0:
+            print(str(len(errors)) + ' files are replaced by other files in the target directory, they will not be copied')
+        relocations = remaining_relocations
+
+    try:
+        if batch:
+            failures = copy_batch(dbx, relocations, batch_size, on_copied=lambda i: record_copy(*relocations[i]))
+            for i in failures.keys():
+                from_path, to_path = relocations[i]
+                errors[from_path] = to_path
+
+        else:
+            for from_path, to_path in tqdm(relocations):
+                #print('Copying from: \n', from_path)
+                #print('to: \n', to_path)
+                try:
+                    dbx.files_copy(
+                        from_path= from_path,
+                        to_path= to_path
+                    )
+                    record_copy(from_path, to_path)
+                except:
+                    errors[from_path] = to_path
+    finally:
+        if journal is not None:
+            journal.close()
 
     transfer_errors_path = 'transfer_errors.json'
     with open(transfer_errors_path, 'w') as f:
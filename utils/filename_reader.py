@@ -1,10 +1,219 @@
-import json
+import functools
 import re
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.globals import CLASSIFICATION_CHUNK_SIZE, STRS_TO_IGNORE_FOR_RUN, STRS_TO_REMOVE_FOR_MODELLING_NEW_PATH
+from utils.misc import get_path_info, load_path_info_data, path_info_data_batch, remove_extension, extract_extension
+
+# regular expressions searched by the extractors, compiled once
+REGEXPS = {
+    # extract_run
+    'run_ct_bin': re.compile(r'CT_\D*_([\d_]*)_bin'),
+    'run_pre_op_ct_bin': re.compile(r'Pre_Op_CT_([\d_]*)_bin'),
+    'run_ct_post_op': re.compile(r'ct_post_op_(\d+)'),
+    'run_spl008_post_op': re.compile(r'SPL008_Post_Op_([\d]+)_'),
+    'run_spl008_post_op_ct_77': re.compile(r'SPL008_Post_Op_CT_77_([\d]+)_'),
+    # extract_sub
+    'sub_others': re.compile(r'/(sub-[\d]*)/'),
+    # extract_type
+    'type_dilate': re.compile(r'dilate_\d*'),
+    # get_ses
+    'ses_others': re.compile(r'/ses-([\d]*)/'),
+    # get_func_task
+    'func_task_others': re.compile(r'task-([^_]*)_'),
+    'func_task_vibrations_joint_movement': re.compile(r'/Vibrations/.*/(Ankle|Hip|Knee)_\d_(ext|flex)'),
+    'func_task_vibrations_joint_dir': re.compile(r'/Vibrations/.*/(Ankle|Hip|Knee)_\d/'),
+    'func_task_vibstim': re.compile(r'task-VibStim_seq(Ankle|Hip|Knee)'),
+    'func_task_joint_movement_mode': re.compile(r'-(ankle|knee|hip)-(flex|ext)-(A|P)-(1|2)\.'),
+    'func_task_vibrations_joint_file': re.compile(r'/Vibrations/.*/(Ankle|Knee|Hip)_(1|2)\.'),
+    # the 5 previous ones can only match where this one matches: the other paths are scanned once instead of 5 times
+    # (they are still searched separately, since the last one matching gives the func_task)
+    'func_task_vibrations_prefilter': re.compile(r'/Vibrations/|task-VibStim_seq|-(?:ankle|knee|hip)-'),
+}
+
+# get_ses: the first of these regular expressions matching (with a non empty group) gives the session
+SES_REGEXPS = [
+    re.compile(r'/(Ankle|Hip|Knee|ankle|hip|knee)_(Ext|Flex|ext|flex)'),
+    re.compile(r'/Structural_([^/]*)'),
+    re.compile(r'/(Vibrations)/'),
+    re.compile(r'/(Ankle|Hip|Knee)_\d'),
+]
+
+
+class ParsedDir:
+    """
+    A directory path split once into the forms used by the functions of `utils.filename_reader.py`,
+    shared by all the files of the directory (see `parse_dir`)
 
-from utils.globals import STRS_TO_IGNORE_FOR_RUN, STRS_TO_REMOVE_FOR_MODELLING_NEW_PATH
-from utils.misc import get_path_info, remove_extension, extract_extension
+    Package
+    ----
+    `utils.filename_reader.py`
 
-    
+    Parameters
+    --------
+        path : str,
+            path of the directory, trailing '/' included ('' for a path without directory)
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    @functools.cached_property
+    def lower(self):
+        # lowercase path of the directory, without the trailing '/'
+        return self.path[:-1].lower()
+
+    @functools.cached_property
+    def keywords(self):
+        # lowercase words of the directories
+        return [keyword.lower() for dir in self.path.split('/')[:-1] for keyword in dir.split('_')]
+
+    @functools.cached_property
+    def keyword_set(self):
+        return frozenset(self.keywords)
+
+
+@functools.lru_cache(maxsize=2**14)
+def parse_dir(dir_path):
+    """
+    Returns the `ParsedDir` of `dir_path`, built once per directory
+
+    Package
+    ----
+    `utils.filename_reader.py`
+
+    Parameters
+    --------
+        dir_path : str,
+            path of the directory, trailing '/' included ('' for a path without directory)
+    """
+    return ParsedDir(dir_path)
+
+
+class ParsedPath:
+    """
+    A path string split once into the forms used by the functions of `utils.filename_reader.py`
+    (lowercase path, parts, filename, extension, keywords, ...), each computed on first use.
+    The results of the extractors (`extract_type`, `get_seg_info`, ...) called with a `ParsedPath` are memoized in it,
+    so that each information is computed only once per path
+
+    Package
+    ----
+    `utils.filename_reader.py`
+
+    Parameters
+    --------
+        path : str,
+            a path/filename string
+
+    Attributes
+    --------
+        path : str,
+            the original path string
+        features : dict,
+            features[extractor name] = result of the extractor for this path
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.features = {}
+
+    def __repr__(self):
+        return 'ParsedPath(' + repr(self.path) + ')'
+
+    @functools.cached_property
+    def lower(self):
+        return self.path.lower()
+
+    @functools.cached_property
+    def parts(self):
+        return self.path.split('/')
+
+    @functools.cached_property
+    def lower_parts(self):
+        return self.lower.split('/')
+
+    @functools.cached_property
+    def extension(self):
+        return extract_extension(self.path)
+
+    @functools.cached_property
+    def filename(self):
+        # lowercase filename without its extension
+        return remove_extension(self.parts[-1]).lower()
+
+    @functools.cached_property
+    def stem(self):
+        # lowercase last part of the path without the extension of the path
+        return remove_extension(self.path).split('/')[-1].lower()
+
+    @functools.cached_property
+    def parent(self):
+        # parent directory, shared by the paths of the same directory
+        return parse_dir(self.path[:len(self.path) - len(self.parts[-1])])
+
+    @functools.cached_property
+    def dirs(self):
+        # lowercase path of the parent directory
+        return self.parent.lower
+
+    @functools.cached_property
+    def keywords(self):
+        # lowercase words of the filename
+        return self.filename.split('_')
+
+    @functools.cached_property
+    def root_dirs_keywords(self):
+        # lowercase words of the directories
+        return self.parent.keywords
+
+    @functools.cached_property
+    def keyword_set(self):
+        return frozenset(self.keywords)
+
+    @functools.cached_property
+    def root_dirs_keyword_set(self):
+        return self.parent.keyword_set
+
+
+def parse_path(input_path):
+    """
+    Returns `input_path` as a `ParsedPath` (unchanged if it already is one)
+
+    Package
+    ----
+    `utils.filename_reader.py`
+
+    Parameters
+    --------
+        input_path : str or ParsedPath,
+            a path/filename string
+    """
+    if isinstance(input_path, ParsedPath):
+        return input_path
+    return ParsedPath(input_path)
+
+
+def path_feature(extractor):
+    """
+    Decorator making an extractor accept a path string or a `ParsedPath`: the extractor receives the `ParsedPath`,
+    and its result is memoized in it (the extractor is only called once per `ParsedPath`, whatever its other arguments, e.g. `debug`)
+
+    Package
+    ----
+    `utils.filename_reader.py`
+    """
+    @functools.wraps(extractor)
+    def wrapper(input_path, *args, **kwargs):
+        path = parse_path(input_path)
+        name = extractor.__name__
+        if name not in path.features:
+            path.features[name] = extractor(path, *args, **kwargs)
+        return path.features[name]
+    return wrapper
+
+
+@path_feature
 def extract_run(input_path, debug=False):
     """
     Returns the run of a filename (SeriesNumber with sometimes additional characters) as a string
@@ -15,7 +224,7 @@ def extract_run(input_path, debug=False):
 
     Parameters
     --------
-        input_path : str,
+        input_path : str or ParsedPath,
             a path/filename string
         debug : bool, default = False
             allows prints for debugging purposes
@@ -25,8 +234,8 @@ def extract_run(input_path, debug=False):
         run_elt: str,
             the run corresponding to the specified filename
     """
-    filename = remove_extension(input_path).split('/')[-1].lower()
-    curated_input_path = input_path.lower()
+    filename = input_path.stem
+    curated_input_path = input_path.lower
     run_index = None
 
     # curate filename to avoid confusions
@@ -49,24 +258,19 @@ def extract_run(input_path, debug=False):
             if (not split_elt.isalpha()) and (not split_elt in ['s4l']):
                 run_elt = run_elt + split_elt.lower()
 
-    pattern1 = re.compile(r'CT_\D*_([\d_]*)_bin')
-    match1 = re.search(pattern1,input_path)
+    match1 = REGEXPS['run_ct_bin'].search(input_path.path)
     if match1:
         run_elt += match1.group(1)
-    pattern2 = re.compile(r'Pre_Op_CT_([\d_]*)_bin')
-    match2 = re.search(pattern2, input_path)
+    match2 = REGEXPS['run_pre_op_ct_bin'].search(input_path.path)
     if match2:
         run_elt += match2.group(1)
-    pattern3 = re.compile(r'ct_post_op_(\d+)')
-    match3 = re.search(pattern3, curated_input_path)
+    match3 = REGEXPS['run_ct_post_op'].search(curated_input_path)
     if match3:
         run_elt += match3.group(1)
-    pattern = re.compile(r'SPL008_Post_Op_([\d]+)_')
-    match = re.search(pattern, input_path)
+    match = REGEXPS['run_spl008_post_op'].search(input_path.path)
     if match:
         run_elt += match.group(1)
-    pattern = re.compile(r'SPL008_Post_Op_CT_77_([\d]+)_')
-    match = re.search(pattern, input_path)
+    match = REGEXPS['run_spl008_post_op_ct_77'].search(input_path.path)
     if match:
         run_elt += match.group(1)
     return run_elt
@@ -82,7 +286,7 @@ def extract_sub(str, participants_dict):
 
     Parameters
     --------
-        str : str,
+        str : str or ParsedPath,
             a path/filename string
         participants_dict : dict
             participants[old_name] = new_name, e.g. participants_dict['REEVOID_001'] = 'sub-01'
@@ -98,18 +302,19 @@ def extract_sub(str, participants_dict):
     #i=1
 
 
+    path = parse_path(str)
+
     #   specific to lumbar_healthy_fmri
-    if str.split('/')[1] == "Vibrations":
-        old_sub = str.split('/')[2]
+    if path.parts[1] == "Vibrations":
+        old_sub = path.parts[2]
     else:
-        old_sub = str.split('/')[1]
+        old_sub = path.parts[1]
     if old_sub in participants_dict.keys():
         sub = participants_dict[old_sub]
     else:
         sub=''
-    if str.split('/')[1] == "_Others":
-        pattern1 = re.compile(r'/(sub-[\d]*)/')
-        match1 = re.search(pattern1,str)
+    if path.parts[1] == "_Others":
+        match1 = REGEXPS['sub_others'].search(path.path)
         if match1:
             sub = match1.group(1).lower()
         else:
@@ -124,9 +329,10 @@ def extract_sub(str, participants_dict):
     #else:
     #    return participants_dict[old_name]
 
-def extract_type(input_path, debug=False):
+def get_type_from_rules(rules, path, debug=False):
     """
-    Returns the suspected type of the specified file.
+    Returns the type given by the first rule of `rules` whose condition is True for `path`
+    (see `TYPE_RULES`, the nested rules are evaluated the same way)
 
     Package
     ----
@@ -134,115 +340,159 @@ def extract_type(input_path, debug=False):
 
     Parameters
     --------
-        input_path : str,
-            a path/filename string
+        rules : list(tuple),
+            rules (name, condition, type or nested rules), condition being a function of a `ParsedPath`
+        path : ParsedPath,
+            a parsed path
         debug : bool, default = False
-            prints variables if set to True
-    
+            prints the name of the matching rule if set to True
+
     Returns
     --------
         type: str,
-            the type of the specified file
+            the type given by the matching rule, None if no rule matches
     """
-    filename = remove_extension(input_path.split('/')[-1]).lower()
-    dirs = '/'.join(input_path.split('/')[:-1]).lower()
-    extension = extract_extension(input_path)
-    keywords = [keyword.lower() for keyword in filename.split('_')]
-    root_dirs_keywords = [keyword.lower() 
-                      for dir in input_path.split('/')[:-1:]
-                      for keyword in dir.split('_') ]
-    if debug:
-        print(root_dirs_keywords)
-    
-    
-    if extension in ['.py', '.ipynb', '.pyc', '.sh', '.fsf' ] or 'scripts' in root_dirs_keywords or 'scripts' in filename :
-        type = 'code'
-    elif extension in ['.avi', '.png', '.pdf', '.mp4', '.pptx', '.docx', '.ai', '.jpg'] or filename == 'screenshots':
-        type = 'misc_derivative'
-    elif 'dti' in keywords or extension in ['.bval', '.bvec']:
-        type = 'dti'
-    
-    elif extension == '.smash' or 'selectivity' in filename or 'simulations_result' in filename:
-        type = 'simulation'
-    
-    elif ('rx' in root_dirs_keywords or 'rx' in keywords or 'x_ray' in input_path.lower()) and (not 'ct_rx' in input_path.lower()):
-        type = 'xray'
-
-
-    elif extension in ['.stl', '.blend', '.blend1', '.obj', '.mtl','.glb', '.vdb', '.ply', '.step', '.3ds', '.iges', '.model', '.sab'] or filename in ['3d_generation', '_all_stls', 'blender'] or '3d_generation' in input_path.lower():
-        type = 'modelling'
-
-    elif ('ct' in keywords or 'ct' in root_dirs_keywords) and extension in ['.nii.gz', '.zip', '.json']:
-        if 'seg' in keywords or 'seg' in root_dirs_keywords or 'tissues' in root_dirs_keywords or 'voxelized' in filename or 'segmentation' in input_path.lower() or get_seg_info(input_path) != "":
-            type = 'ct_segmentation'
-        elif 'bin' in keywords or 'metal' in keywords: 
+    for name, condition, result in rules:
+        if condition(path):
+            if debug:
+                print('type rule: ', name)
+            if isinstance(result, list):
+                return get_type_from_rules(result, path, debug=debug)
+            return result
+    return None
+
+
+def always(path):
+    return True
+
+
+# rules of `extract_type`, evaluated in this order, the first one matching gives the type: (name, condition, type or nested rules)
+# the conditions only use the features of the `ParsedPath` (computed once per path), get_seg_info and get_func_task being computed only if needed
+TYPE_RULES = [
+    ('code',
+        lambda p: p.extension in ['.py', '.ipynb', '.pyc', '.sh', '.fsf' ] or 'scripts' in p.root_dirs_keyword_set or 'scripts' in p.filename,
+        'code'),
+    ('misc_derivative',
+        lambda p: p.extension in ['.avi', '.png', '.pdf', '.mp4', '.pptx', '.docx', '.ai', '.jpg'] or p.filename == 'screenshots',
+        'misc_derivative'),
+    ('dti',
+        lambda p: 'dti' in p.keyword_set or p.extension in ['.bval', '.bvec'],
+        'dti'),
+    ('simulation',
+        lambda p: p.extension == '.smash' or 'selectivity' in p.filename or 'simulations_result' in p.filename,
+        'simulation'),
+    ('xray',
+        lambda p: ('rx' in p.root_dirs_keyword_set or 'rx' in p.keyword_set or 'x_ray' in p.lower) and (not 'ct_rx' in p.lower),
+        'xray'),
+    ('modelling',
+        lambda p: p.extension in ['.stl', '.blend', '.blend1', '.obj', '.mtl','.glb', '.vdb', '.ply', '.step', '.3ds', '.iges', '.model', '.sab'] or p.filename in ['3d_generation', '_all_stls', 'blender'] or '3d_generation' in p.lower,
+        'modelling'),
+    ('ct',
+        lambda p: ('ct' in p.keyword_set or 'ct' in p.root_dirs_keyword_set) and p.extension in ['.nii.gz', '.zip', '.json'],
+        [
+            ('ct_segmentation',
+                lambda p: 'seg' in p.keyword_set or 'seg' in p.root_dirs_keyword_set or 'tissues' in p.root_dirs_keyword_set or 'voxelized' in p.filename or 'segmentation' in p.lower or get_seg_info(p) != "",
+                'ct_segmentation'),
             ### this case might be specific to t2g_sub02 !!
-            type= 'ct_segmentation' 
-        else:
-            type = 'ct'
-    
+            ('ct_bin_or_metal',
+                lambda p: 'bin' in p.keyword_set or 'metal' in p.keyword_set,
+                'ct_segmentation'),
+            ('ct_other', always, 'ct'),
+        ]),
     #specific to up2003
-    elif "bold_moco_p2" in filename or "iso_tr2_pat2_on_wip_advphysio" in filename or "_bold_" in filename:
-        type = "func"
-    
-    elif filename in ['order_runs', 'notes'] or 'timings' in root_dirs_keywords or 'physiological' in filename or 'physiological' in root_dirs_keywords:
-        type = "func"
-
-    elif ('structural' in keywords or 'structural' in root_dirs_keywords or 'mri' in keywords or 'mri' in root_dirs_keywords) and (not 'functional' in root_dirs_keywords):
-        pattern = re.compile(r'dilate_\d*')
-        if re.search(pattern, filename) or "wimagine_covers_center" in filename or "visualization" in root_dirs_keywords or "/straighten_with_seg/" in input_path.lower():
-            type = "anat_derivatives"
-        elif 'seg' in keywords or 'mask' in keywords or 'tissues' in root_dirs_keywords or 'seg' in root_dirs_keywords or 'segmentations' in root_dirs_keywords or ('segmentation' in root_dirs_keywords and (not 'im' in root_dirs_keywords ) and (not 'im_straight' in root_dirs_keywords))or 'voxelized' in filename:
-            type = 'anat_segmentation'
-        elif "spinal_levels" in dirs:
-            type = 'anat_segmentation'
-        elif 'betted' in filename or 'transf' in filename or 'template' in filename or 'preprocessed' in input_path.lower() or 'pre_processed' in input_path.lower() or extension in ['.mat'] or 'im_straight' in root_dirs_keywords:
-            if debug:
-                print(filename)
-            type = 'anat_derivatives'
-        elif filename in ['straight_ref', 'warp_straight2curve', "warp_curve2straight"]:
-            type = "anat_derivatives"
-        elif "straightening" in root_dirs_keywords or "straighten" in root_dirs_keywords:
-            type = "anat_derivatives"
-        else:
-            type = 'anat'
-
-
-    elif 'restingstate' in keywords or 'fmri' in input_path.lower() or 'functional' in input_path.lower() or 'physiolog' in filename or get_func_task(input_path) != '' or 'bold_moco_p2' in filename:
-        if filename in ["fmri", "timings", "order_runs"] or 'bold_moco_p2' in filename:
-            type = 'func'
-        elif ('seg' in root_dirs_keywords or 'segmentation' in root_dirs_keywords or 'segmentation_functional' in input_path.lower() or get_seg_info(input_path) != '') and extension != ".feat":
-            type = 'func_segmentation'
-        elif 'thresh_zscores' in input_path.lower() or "zstat1" in input_path.lower():
-            type = 'func_derivatives'
-        elif extension == '.feat' or 'thresh_zstat1_reg' in filename or 'acompcor' in filename or 'rmsctp0fmri' in filename:
-            type = 'func_derivatives'
-        else:
-            type = 'func'
-    
-    elif extension == '.feat' or 'thresh_zstat1_reg' in filename or 'acompcor' in filename or 'rmsctp0fmri' in filename:
-        type = 'func_derivatives'
-    
-    
-
-    
-    elif 'spinal_level' in dirs or sum([word in filename for word in ['roots_out','roots_rootlets', 'roots_seg_to_centerline', 'centerline']])>=1 or ('intersections' in filename) or ('segmentation' in input_path.lower()) :
-        type = 'anat_segmentation'
+    ('func_up2003',
+        lambda p: "bold_moco_p2" in p.filename or "iso_tr2_pat2_on_wip_advphysio" in p.filename or "_bold_" in p.filename,
+        'func'),
+    ('func_notes',
+        lambda p: p.filename in ['order_runs', 'notes'] or 'timings' in p.root_dirs_keyword_set or 'physiological' in p.filename or 'physiological' in p.root_dirs_keyword_set,
+        'func'),
+    ('anat',
+        lambda p: ('structural' in p.keyword_set or 'structural' in p.root_dirs_keyword_set or 'mri' in p.keyword_set or 'mri' in p.root_dirs_keyword_set) and (not 'functional' in p.root_dirs_keyword_set),
+        [
+            ('anat_visualization',
+                lambda p: REGEXPS['type_dilate'].search(p.filename) or "wimagine_covers_center" in p.filename or "visualization" in p.root_dirs_keyword_set or "/straighten_with_seg/" in p.lower,
+                'anat_derivatives'),
+            ('anat_segmentation',
+                lambda p: 'seg' in p.keyword_set or 'mask' in p.keyword_set or 'tissues' in p.root_dirs_keyword_set or 'seg' in p.root_dirs_keyword_set or 'segmentations' in p.root_dirs_keyword_set or ('segmentation' in p.root_dirs_keyword_set and (not 'im' in p.root_dirs_keyword_set ) and (not 'im_straight' in p.root_dirs_keyword_set))or 'voxelized' in p.filename,
+                'anat_segmentation'),
+            ('anat_spinal_levels',
+                lambda p: "spinal_levels" in p.dirs,
+                'anat_segmentation'),
+            ('anat_preprocessed',
+                lambda p: 'betted' in p.filename or 'transf' in p.filename or 'template' in p.filename or 'preprocessed' in p.lower or 'pre_processed' in p.lower or p.extension in ['.mat'] or 'im_straight' in p.root_dirs_keyword_set,
+                'anat_derivatives'),
+            ('anat_straightening_warps',
+                lambda p: p.filename in ['straight_ref', 'warp_straight2curve', "warp_curve2straight"],
+                'anat_derivatives'),
+            ('anat_straightening',
+                lambda p: "straightening" in p.root_dirs_keyword_set or "straighten" in p.root_dirs_keyword_set,
+                'anat_derivatives'),
+            ('anat_other', always, 'anat'),
+        ]),
+    ('func',
+        lambda p: 'restingstate' in p.keyword_set or 'fmri' in p.lower or 'functional' in p.lower or 'physiolog' in p.filename or get_func_task(p) != '' or 'bold_moco_p2' in p.filename,
+        [
+            ('func_timings',
+                lambda p: p.filename in ["fmri", "timings", "order_runs"] or 'bold_moco_p2' in p.filename,
+                'func'),
+            ('func_segmentation',
+                lambda p: ('seg' in p.root_dirs_keyword_set or 'segmentation' in p.root_dirs_keyword_set or 'segmentation_functional' in p.lower or get_seg_info(p) != '') and p.extension != ".feat",
+                'func_segmentation'),
+            ('func_zstats',
+                lambda p: 'thresh_zscores' in p.lower or "zstat1" in p.lower,
+                'func_derivatives'),
+            ('func_feat',
+                lambda p: p.extension == '.feat' or 'thresh_zstat1_reg' in p.filename or 'acompcor' in p.filename or 'rmsctp0fmri' in p.filename,
+                'func_derivatives'),
+            ('func_other', always, 'func'),
+        ]),
+    ('func_derivatives',
+        lambda p: p.extension == '.feat' or 'thresh_zstat1_reg' in p.filename or 'acompcor' in p.filename or 'rmsctp0fmri' in p.filename,
+        'func_derivatives'),
+    ('segmentation_keywords',
+        lambda p: 'spinal_level' in p.dirs or sum([word in p.filename for word in ['roots_out','roots_rootlets', 'roots_seg_to_centerline', 'centerline']])>=1 or ('intersections' in p.filename) or ('segmentation' in p.lower),
+        'anat_segmentation'),
+    ('nifti',
+        lambda p: p.extension in ['.nii.gz', '.nii'],
+        [
+            ('nifti_segmentation',
+                lambda p: get_seg_info(p) != '',
+                'anat_segmentation'),
+            ('nifti_other', always, 'anat'),
+        ]),
+    ('model_dir',
+        lambda p: 'model' in p.root_dirs_keyword_set,
+        'modelling'),
+    ('misc', always, 'misc'),
+]
+
+
+@path_feature
+def extract_type(input_path, debug=False):
+    """
+    Returns the suspected type of the specified file, given by the first matching rule of `TYPE_RULES`.
 
-    
+    Package
+    ----
+    `utils.filename_reader.py`
 
-    elif extension in ['.nii.gz', '.nii']:
-        if get_seg_info(input_path) != '':
-            type = 'anat_segmentation'
-        else:
-            type = 'anat'
-    elif 'model' in root_dirs_keywords:
-        type = 'modelling'
-    else:
-        type = 'misc'
+    Parameters
+    --------
+        input_path : str or ParsedPath,
+            a path/filename string
+        debug : bool, default = False
+            prints variables and the matching rules if set to True
     
-    return type
+    Returns
+    --------
+        type: str,
+            the type of the specified file
+    """
+    if debug:
+        print(input_path.root_dirs_keywords)
+    return get_type_from_rules(TYPE_RULES, input_path, debug=debug)
 
+@path_feature
 def get_ses(input_path, debug=False):
     """
     Returns the session identifier (specific to lumbar_healthy_fmri)
@@ -253,7 +503,7 @@ def get_ses(input_path, debug=False):
     
     Parameters
     --------
-        input_path : str,
+        input_path : str or ParsedPath,
             a path/filename string
         debug : bool, default = False
             prints variables if set to True
@@ -264,23 +514,17 @@ def get_ses(input_path, debug=False):
             the session of the specified file
     """
     ses = ''
-    regexps = [
-        r'/(Ankle|Hip|Knee|ankle|hip|knee)_(Ext|Flex|ext|flex)',
-        r'/Structural_([^/]*)',
-        r'/(Vibrations)/',
-        r'/(Ankle|Hip|Knee)_\d'
-    ]
-    for regexp in regexps:
-        pattern = re.compile(regexp)
-        match = re.search(pattern,input_path)
-        if match and ses == '':
+    for pattern in SES_REGEXPS:
+        if ses != '':
+            break
+        match = pattern.search(input_path.path)
+        if match:
             ses = match.group(1).lower()
 
     if ses == 'vibrations':
         ses = 'vibration'
-    if input_path.split('/')[1] == "_Others":
-        pattern1 = re.compile(r'/ses-([\d]*)/')
-        match1 = re.search(pattern1,input_path)
+    if input_path.parts[1] == "_Others":
+        match1 = REGEXPS['ses_others'].search(input_path.path)
         if match1:
             ses = match1.group(1).lower()
         else:
@@ -288,6 +532,7 @@ def get_ses(input_path, debug=False):
     return ses
 
 
+@path_feature
 def get_category(input_path, debug=False):
     """
     Returns additional information on the data
@@ -300,7 +545,7 @@ def get_category(input_path, debug=False):
     
     Parameters
     --------
-        input_path : str,
+        input_path : str or ParsedPath,
             a path/filename string
         debug : bool, default = False
             prints variables if set to True
@@ -312,7 +557,7 @@ def get_category(input_path, debug=False):
     """
 
     category = get_path_info(
-        path= input_path,
+        path= input_path.path,
         data_path='utils/category.json',
         debug=debug
     )
@@ -320,6 +565,7 @@ def get_category(input_path, debug=False):
 
 
 
+@path_feature
 def get_seg_info(input_path, debug=False):
     """
     Returns additional information about a segmentation (if it is a mask, which part was targeted, which tools were used to segment, ...)
@@ -332,7 +578,7 @@ def get_seg_info(input_path, debug=False):
     
     Parameters
     --------
-        input_path : str,
+        input_path : str or ParsedPath,
             a path/filename string
     
     Returns
@@ -340,7 +586,7 @@ def get_seg_info(input_path, debug=False):
         seg_info: str,
     """
     seg_info = get_path_info(
-        path= input_path,
+        path= input_path.path,
         data_path='utils/seg_info.json',
         debug=debug
     )
@@ -349,6 +595,7 @@ def get_seg_info(input_path, debug=False):
 
 
 
+@path_feature
 def get_func_task(input_path, debug=False):
     """
     Returns the task performed for fMRI
@@ -359,7 +606,7 @@ def get_func_task(input_path, debug=False):
     
     Parameters
     --------
-        str : str,
+        input_path : str or ParsedPath,
             a path/filename string
     
     Returns
@@ -378,42 +625,37 @@ def get_func_task(input_path, debug=False):
     'left_grasp'
     """
     func_task = ''
-    if len(input_path.split('/')[1]) >= 2:
-        if input_path.split('/')[1] == "_Others":
-            pattern1 = re.compile(r'task-([^_]*)_')
-            match1 = re.search(pattern1,input_path)
+    if len(input_path.parts[1]) >= 2:
+        if input_path.parts[1] == "_Others":
+            match1 = REGEXPS['func_task_others'].search(input_path.path)
             if match1:
                 func_task = match1.group(1).lower()
     
     func_task += get_path_info(
-        path= input_path,
+        path= input_path.path,
         data_path='utils/func_task.json'
     )
 
-    pattern = re.compile(r'/Vibrations/.*/(Ankle|Hip|Knee)_\d_(ext|flex)')
-    match = re.search(pattern,input_path)
-    if match:
-        func_task = match.group(1).lower() + '_' + match.group(2) + '_' + 'vibration'
+    if REGEXPS['func_task_vibrations_prefilter'].search(input_path.path):
+        match = REGEXPS['func_task_vibrations_joint_movement'].search(input_path.path)
+        if match:
+            func_task = match.group(1).lower() + '_' + match.group(2) + '_' + 'vibration'
 
-    pattern = re.compile(r'/Vibrations/.*/(Ankle|Hip|Knee)_\d/')
-    match = re.search(pattern,input_path)
-    if match:
-        func_task = match.group(1).lower() + '_' + 'vibration'
+        match = REGEXPS['func_task_vibrations_joint_dir'].search(input_path.path)
+        if match:
+            func_task = match.group(1).lower() + '_' + 'vibration'
 
-    pattern = re.compile(r'task-VibStim_seq(Ankle|Hip|Knee)')
-    match = re.search(pattern,input_path)
-    if match:
-        func_task = match.group(1).lower() + '_' + 'vibration'
-    
-    pattern = re.compile(r'-(ankle|knee|hip)-(flex|ext)-(A|P)-(1|2)\.')
-    match = re.search(pattern,input_path)
-    if match:
-        func_task = match.group(1).lower() + '_' + match.group(2).lower() +'_' + match.group(3).lower()
+        match = REGEXPS['func_task_vibstim'].search(input_path.path)
+        if match:
+            func_task = match.group(1).lower() + '_' + 'vibration'
+        
+        match = REGEXPS['func_task_joint_movement_mode'].search(input_path.path)
+        if match:
+            func_task = match.group(1).lower() + '_' + match.group(2).lower() +'_' + match.group(3).lower()
 
-    pattern = re.compile(r'/Vibrations/.*/(Ankle|Knee|Hip)_(1|2)\.')
-    match = re.search(pattern,input_path)
-    if match:
-        func_task = match.group(1).lower() + '_' "vibration"
+        match = REGEXPS['func_task_vibrations_joint_file'].search(input_path.path)
+        if match:
+            func_task = match.group(1).lower() + '_' "vibration"
 
     #specific to lumbar_health_fmri
     to_replace = ["_flex_", "_ext_", "_p", "_a"]
@@ -423,6 +665,7 @@ def get_func_task(input_path, debug=False):
     return func_task
 
 
+@path_feature
 def get_func_info(input_path):
     """
     Returns additional information about fMRI 
@@ -433,7 +676,7 @@ def get_func_info(input_path):
     
     Parameters
     --------
-        input_path : str,
+        input_path : str or ParsedPath,
             a path/filename string
     
     Returns
@@ -462,12 +705,13 @@ def get_func_info(input_path):
     """
 
     seg_info = get_path_info(
-        path= input_path,
+        path= input_path.path,
         data_path='utils/func_info.json'
     )
     return seg_info
 
 
+@path_feature
 def get_suffix(string, debug=False):
     """
     Returns the suffix for the new path, should contain information about the imaging sequence and/or the type of signal, or anything supplementary
@@ -478,7 +722,7 @@ def get_suffix(string, debug=False):
     
     Parameters
     --------
-        string : str,
+        string : str or ParsedPath,
             a path/filename string
     
     Returns
@@ -487,17 +731,19 @@ def get_suffix(string, debug=False):
     """
     
 
-    type = extract_type(string)
+    path = string
+    string = path.path
+
+    type = extract_type(path)
 
-    with open('utils/suffix.json', 'r') as f:
-        data = json.load(f)
+    data = load_path_info_data('utils/suffix.json')
 
     # curate filename to avoid confusions
     strings_to_ignore = data["to_ignore"]
     
     
 
-    filename = remove_extension(string.split('/')[-1]).lower()
+    filename = path.filename
 
     for s in strings_to_ignore:
         filename = filename.replace(s, '')
@@ -540,7 +786,7 @@ def get_suffix(string, debug=False):
         if additional not in suffix:
             suffix = suffix + '_' + additional
 
-    extras = data['extra']
+    extras = list(data['extra'])
     extras += ['v0' + str(i) for i in range(10)]
     extras += ['v' + str(i) for i in range(10)]
 
@@ -612,6 +858,7 @@ def is_derivative(type):
     """
     return 'segmentation' in type or (type in ['modelling', 'simulation']) or 'derivative' in type
 
+@path_feature
 def is_localizer(input_path):
     """
     Package
@@ -620,7 +867,7 @@ def is_localizer(input_path):
 
     Parameters
     --------
-        str : str,
+        input_path : str or ParsedPath,
             a path/filename string
     
     Returns
@@ -630,9 +877,9 @@ def is_localizer(input_path):
     
     Errors for json files will be handled thanks to functions in utils.save_logs
     """
-    filename = remove_extension(input_path).split('/')[-1].lower()
+    filename = input_path.stem
     try:
-        last_dir = input_path.split('/')[-2].lower()
+        last_dir = input_path.lower_parts[-2]
     except:
         last_dir = ''
     is_localizer_bool = 'localizer' in last_dir or 'localizer' in filename
@@ -640,6 +887,7 @@ def is_localizer(input_path):
 
     return is_localizer_bool
 
+@path_feature
 def is_other(str, debug=False):
     """
     Package
@@ -648,7 +896,7 @@ def is_other(str, debug=False):
 
     Parameters
     --------
-        str : str,
+        str : str or ParsedPath,
             a path/filename string
     
     Returns
@@ -657,7 +905,7 @@ def is_other(str, debug=False):
             True iff the file is in an "other" subdirectory
     """
     try:
-        last_dir = str.split('/')[-2].lower()
+        last_dir = str.lower_parts[-2]
         if debug:
             print(last_dir)
             print('other' in last_dir)
@@ -667,6 +915,7 @@ def is_other(str, debug=False):
     except:
         return False
     
+@path_feature
 def is_a_previous_version(input_path):
     """
     Package
@@ -675,7 +924,7 @@ def is_a_previous_version(input_path):
     
     Parameters
     --------
-        input_path : str,
+        input_path : str or ParsedPath,
             a path/filename string
     
     Returns
@@ -683,12 +932,13 @@ def is_a_previous_version(input_path):
         is_a_previous_version_bool: bool,
             True iff the file is a previous version
     """
-    b1 = 'previous_version' in input_path.lower() 
-    b2 = 'version_2024' in input_path.lower() 
-    b3 = '_previous' in input_path.lower().split('/')
+    b1 = 'previous_version' in input_path.lower 
+    b2 = 'version_2024' in input_path.lower 
+    b3 = '_previous' in input_path.lower_parts
     is_a_previous_version_bool = b1 or b2 or b3
     return is_a_previous_version_bool
 
+@path_feature
 def is_tmp(input_path):
     """
     Package
@@ -697,7 +947,7 @@ def is_tmp(input_path):
     
     Parameters
     --------
-        input_path : str,
+        input_path : str or ParsedPath,
             a path/filename string
     
     Returns
@@ -705,7 +955,7 @@ def is_tmp(input_path):
         is_tmp_bool: bool,
             True iff the file is suspected to be a temporary file (contains 'tmp' in its path)
     """
-    is_tmp_bool = 'tmp' in input_path.lower() or 'test' in input_path.lower()
+    is_tmp_bool = 'tmp' in input_path.lower or 'test' in input_path.lower
     return is_tmp_bool
 
 
@@ -725,7 +975,7 @@ def generate_new_path(old_path, sub, run, type, category, seg_info, func_task, f
     
     Parameters
     --------
-        old_path : str,
+        old_path : str or ParsedPath,
         sub : str,
         ses : str,
         run : str,
@@ -747,6 +997,9 @@ def generate_new_path(old_path, sub, run, type, category, seg_info, func_task, f
         new_path : str,
             new path for the original file
     """
+    path = parse_path(old_path)
+    old_path = path.path
+
     new_path = ''
 
     sub_ses_folder = sub
@@ -766,17 +1019,17 @@ def generate_new_path(old_path, sub, run, type, category, seg_info, func_task, f
 
     elif type =='code':
         try:
-            if old_path.lower().split('/')[-1] != 'scripts':
-                simplified_old_path = '/' + '_'.join(old_path.lower().split('/')[:-1]).strip('_') + '/' + old_path.lower().split('/')[-1]
+            if path.lower_parts[-1] != 'scripts':
+                simplified_old_path = '/' + '_'.join(path.lower_parts[:-1]).strip('_') + '/' + path.lower_parts[-1]
             else:
-                simplified_old_path = '/' + '_'.join(old_path.lower().split('/')[:-1]).strip('_')
+                simplified_old_path = '/' + '_'.join(path.lower_parts[:-1]).strip('_')
         except:
-            simplified_old_path = old_path.lower()
+            simplified_old_path = path.lower
         try:
             if simplified_old_path.split('_')[0] in ['/up200' + str(i) for i in range(1,5) ]:
                 simplified_old_path = '_'.join(simplified_old_path.split('_')[1:])
         except:
-            simplified_old_path = old_path.lower()
+            simplified_old_path = path.lower
         for i in range(1,5):
             sub_code = 'up200' + str(i)
             while sub_code in simplified_old_path:
@@ -791,10 +1044,10 @@ def generate_new_path(old_path, sub, run, type, category, seg_info, func_task, f
     elif type in ['misc','modelling']:
         new_path = 'derivatives/' + type
 
-        if old_path.lower().split('/')[1] in ['up200' + str(i) for i in range(1,5) ]:
-            simplified_old_path = '/'.join(old_path.split('/')[2:]).lower()
+        if path.lower_parts[1] in ['up200' + str(i) for i in range(1,5) ]:
+            simplified_old_path = '/'.join(path.parts[2:]).lower()
         else:
-            simplified_old_path = old_path.lower()
+            simplified_old_path = path.lower
 
         for string in STRS_TO_REMOVE_FOR_MODELLING_NEW_PATH:
             simplified_old_path = simplified_old_path.replace(string.lower(),'')
@@ -814,7 +1067,7 @@ def generate_new_path(old_path, sub, run, type, category, seg_info, func_task, f
                 new_path += type +'/' + sub_ses_folder + '/'
         else:
             new_path += sub_ses_folder + '/' + type + '/'
-            if ('dicom' in old_path.lower() or type in ['anat','func','ct']) and extension==".zip":
+            if ('dicom' in path.lower or type in ['anat','func','ct']) and extension==".zip":
                 new_path += 'dicom/'
 
         if is_localizer_bool:
@@ -843,8 +1096,8 @@ def generate_new_path(old_path, sub, run, type, category, seg_info, func_task, f
             elif func_info in seg_info:
                 func_info= ''
             elements = [sub_ses_file, category, run_element, task_elt, func_info, seg_info, suffix_elt]  
-        elif type == 'simulation' and 'selectivity' in old_path.split('/')[-1].lower():
-            end = old_path.split('/')[-1].lower().strip('_')
+        elif type == 'simulation' and 'selectivity' in path.parts[-1].lower():
+            end = path.parts[-1].lower().strip('_')
             elements = [sub_ses_file, category, end]
         else:
             elements = [sub_ses_file, category, run_element, seg_info, suffix_elt]
@@ -866,7 +1119,7 @@ def create_filename_dict(str, participants_dict, **kwargs):
     
     Parameters
     --------
-        str : str,
+        str : str or ParsedPath,
             a path/filename string
         participants_dict : dict,
             new sub name given to the former one (e.g. participants_dict['REEVOID_PILOT_01'] = 'sub-pilot')
@@ -893,14 +1146,17 @@ def create_filename_dict(str, participants_dict, **kwargs):
         is_a_previous_version : Bool,
         is_derivative : Bool,
     """
+    # the path is parsed once, and shared by all the extractors
+    path = parse_path(str)
+
     out = {}
-    out["old_path"] = str
-    run = extract_run(str)
+    out["old_path"] = path.path
+    run = extract_run(path)
     out["run"] = run
 
     if 'sub' not in kwargs.keys():
         try:
-            sub = extract_sub(str, participants_dict)
+            sub = extract_sub(path, participants_dict)
         except AssertionError:
             sub= 'sub'
     else:
@@ -908,23 +1164,23 @@ def create_filename_dict(str, participants_dict, **kwargs):
     out["sub"] = sub
     
     if 'type' not in kwargs.keys():
-        type = extract_type(str)
+        type = extract_type(path)
     else:
         type = kwargs['type']
     out['type'] = type
 
-    extension = extract_extension(str)
+    extension = path.extension
     out['extension'] = extension
     
     if 'category' not in kwargs.keys():
-        category = get_category(str)
+        category = get_category(path)
     else:
         category = kwargs['category']
     out['category'] = category
 
     if 'seg_info' not in kwargs.keys():
         if 'segmentation' in type:
-            seg_info = get_seg_info(str)
+            seg_info = get_seg_info(path)
             out['seg_info'] = seg_info
         else :
             seg_info = ''
@@ -933,12 +1189,12 @@ def create_filename_dict(str, participants_dict, **kwargs):
         out['seg_info'] = seg_info
     
     if 'func_task' not in kwargs.keys():
-        func_task = get_func_task(str)
+        func_task = get_func_task(path)
     else:
         func_task = kwargs['func_task']        
     
     if 'func_info' not in kwargs.keys():
-        func_info = get_func_info(str)
+        func_info = get_func_info(path)
     else:
         func_info = kwargs['func_info']
     
@@ -946,28 +1202,28 @@ def create_filename_dict(str, participants_dict, **kwargs):
         out['func_task'] = func_task
         out['func_info'] = func_info
     
-    is_tmp_bool = is_tmp(str)
+    is_tmp_bool = is_tmp(path)
     out['is_tmp'] = is_tmp_bool
 
     if 'is_localizer' not in kwargs.keys():
-        is_localizer_bool = is_localizer(str)
+        is_localizer_bool = is_localizer(path)
     else:
         is_localizer_bool = kwargs['is_localizer']
     out['is_localizer'] = is_localizer_bool
 
     if 'is_other' not in kwargs.keys():
-        is_other_bool = is_other(str)
+        is_other_bool = is_other(path)
     else:
         is_other_bool = kwargs['is_other']
     out['is_other'] = is_other_bool
 
     if 'is_a_previous_version' not in kwargs.keys():
-        is_a_previous_version_bool = is_a_previous_version(str)
+        is_a_previous_version_bool = is_a_previous_version(path)
     else:
         is_a_previous_version_bool = kwargs['is_a_previous_version']
     out['is_a_previous_version'] = is_a_previous_version_bool
 
-    suffix = get_suffix(str)
+    suffix = get_suffix(path)
     out['suffix'] = suffix
 
 
@@ -980,7 +1236,7 @@ def create_filename_dict(str, participants_dict, **kwargs):
 
 
     new_path = generate_new_path(
-        str,
+        path,
         sub,
         run,
         type,
@@ -1000,3 +1256,71 @@ def create_filename_dict(str, participants_dict, **kwargs):
     out['new_path'] = new_path
 
     return out
+
+
+def create_filename_dicts(input_files, participants_dict, workers=None, chunk_size=CLASSIFICATION_CHUNK_SIZE, **kwargs):
+    """
+    Returns the `create_filename_dict` of each path in `input_files`, in the same order,
+    the paths being classified by a pool of `workers` processes, `chunk_size` consecutive paths at a time
+    (consecutive paths often share their directories, see `parse_dir`)
+
+    The results are the same as with a loop over `input_files`
+
+    Package
+    ----
+    `utils.filename_reader.py`
+
+    Parameters
+    --------
+        input_files : list(str),
+            a list of path strings
+        participants_dict : dict,
+            new sub name given to the former one (e.g. participants_dict['REEVOID_PILOT_01'] = 'sub-pilot')
+        workers : int, default=None,
+            number of processes (the number of CPUs if None), the paths are classified in this process if workers is 1
+            or if there is at most one chunk of paths
+        chunk_size : int, default=CLASSIFICATION_CHUNK_SIZE,
+            number of paths sent at once to a process
+        **kwargs
+            see `create_filename_dict`
+
+    Returns
+    --------
+        out : list(dict),
+            out[i] = create_filename_dict(input_files[i], participants_dict, **kwargs)
+    """
+    if workers == 1 or len(input_files) <= chunk_size:
+        return create_filename_dicts_batch(input_files, participants_dict, kwargs)
+
+    # map returns the results in the order of the chunks
+    chunks = [input_files[i:i + chunk_size] for i in range(0, len(input_files), chunk_size)]
+    classify_chunk = functools.partial(create_filename_dicts_batch, participants_dict=participants_dict, kwargs=kwargs)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return [file_infos for chunk_file_infos in executor.map(classify_chunk, chunks) for file_infos in chunk_file_infos]
+
+
+def create_filename_dicts_batch(input_files, participants_dict, kwargs):
+    """
+    Returns the `create_filename_dict` of each path in `input_files`, in the same order, classified in this process
+    as one batch: the expression dictionaries are checked for modifications once for the whole batch (see `utils.misc.path_info_data_batch`)
+
+    Package
+    ----
+    `utils.filename_reader.py`
+
+    Parameters
+    --------
+        input_files : list(str),
+            a list of path strings
+        participants_dict : dict,
+            new sub name given to the former one (e.g. participants_dict['REEVOID_PILOT_01'] = 'sub-pilot')
+        kwargs : dict,
+            kwargs of `create_filename_dict`
+
+    Returns
+    --------
+        out : list(dict),
+            out[i] = create_filename_dict(input_files[i], participants_dict, **kwargs)
+    """
+    with path_info_data_batch():
+        return [create_filename_dict(file, participants_dict, **kwargs) for file in input_files]
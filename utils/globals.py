@@ -36,7 +36,21 @@ STRS_TO_IGNORE_FOR_RUN = [
     "_bin_99p",
 ]
 
-MAX_FILE_SIZE_FOR_COMPARISON = (2**10) ** 3  # 1Go limit when downloading for comparison
+COMPARISON_BLOCK_SIZE = 2**20  # 1Mo blocks when streaming files for comparison (the comparison stops at the first different block)
+
+FINGERPRINT_SIZE = 64 * 2**10  # 64Ko downloaded at the beginning and at the end of the files with the same size, before comparing them entirely
+
+DOWNLOAD_CACHE_DIR = 'download_cache/'  # local copies of the downloaded files, kept from one run to the next
+
+DOWNLOAD_CACHE_MAX_BYTES = 20 * (2**10) ** 3  # 20Go disk budget of the download cache, the least recently used files are removed above it
+
+CLASSIFICATION_CHUNK_SIZE = 1000  # paths classified together by each process of the pool (see `utils.filename_reader.create_filename_dicts`)
+
+CLASSIFICATION_CACHE_PATH = 'classification_cache/file_infos.sqlite'  # file infos of the classified paths, kept from one run to the next
+
+DROPBOX_MAX_CONNECTIONS = 16  # HTTP connections kept alive by the shared Dropbox client, should be >= the number of workers (two per worker when streaming duplicates)
+
+DROPBOX_TRANSFER_TIMEOUT = 900  # timeout (in seconds) of the Dropbox uploads and downloads, long enough for large files (the other requests keep the 100s default of the SDK)
 
 STRS_TO_REMOVE_FOR_JSONS_TO_DATA = [
     ".",
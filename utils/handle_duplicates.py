@@ -1,21 +1,77 @@
-import dropbox
+import hashlib
 import json
-import filecmp
 import os
-import sys
+from bisect import bisect_left
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
-from dropbox.exceptions import AuthError
 from tqdm import tqdm
 
-from utils.globals import MAX_FILE_SIZE_FOR_COMPARISON
-from utils.misc import remove_extension, extract_extension, clean_up_tmpdir
+from utils.download_cache import DownloadCache, iter_download_blocks
+from utils.dropbox_client import get_dropbox_client
+from utils.globals import COMPARISON_BLOCK_SIZE, DOWNLOAD_CACHE_DIR, DROPBOX_TRANSFER_TIMEOUT, FINGERPRINT_SIZE
+from utils.misc import remove_extension, extract_extension
+from utils.save_logs import read_file_metadata
+
+def group_same_new_paths(file_infos):
+    """
+    Returns the groups of different files having the same new path, in one pass over the file infos
+
+    Package
+    ----
+    `utils.handle_duplicates.py`
+
+    Parameters
+    --------
+        file_infos : dict,
+            file infos (see `utils.save_logs.save_file_infos`)
+
+    Returns
+    --------
+        flagged_dict : dict,
+            flagged_dict[file1] = list(files with the same new path as file1, file1 included), in the order of file_infos,
+            file1 being the first of them (and appearing only if there are several)
+    """
+    files_by_new_path = {}
+    for file in file_infos.keys():
+        files_by_new_path.setdefault(file_infos[file]['new_path'], []).append(file)
+    return {files[0]: files for files in files_by_new_path.values() if len(files) > 1}
+
+def rename_same_new_paths(file_infos, flagged_dict):
+    """
+    Returns a copy of the file infos in which the files of each group of `flagged_dict` have the suffix `_duplicate-[i]` in their new path
+
+    Package
+    ----
+    `utils.handle_duplicates.py`
+
+    Parameters
+    --------
+        file_infos : dict,
+            file infos (see `utils.save_logs.save_file_infos`), not modified
+        flagged_dict : dict,
+            groups of files with the same new path (see `group_same_new_paths`)
+
+    Returns
+    --------
+        new_file_infos : dict,
+            updated file infos
+    """
+    new_file_infos = file_infos.copy()
+    for key in flagged_dict.keys():
+        for i, file in enumerate(flagged_dict[key]):
+            original_new_path = file_infos[file]['new_path']
+            final_new_path = remove_extension(original_new_path) + '_duplicate-' + str(i) + extract_extension(original_new_path)
+            new_file_infos[file] = dict(file_infos[file], new_path=final_new_path)
+    return new_file_infos
 
 def flag_same_new_paths(file_infos_path, flagged_path):
     """
     Saves a json in `flagged_path` flagging different files that may have the same new path
 
     **Overwrites any existing file in `flagged_path`**
-    
+
     Package
     ----
     `utils.handle_duplicates.py`
@@ -26,7 +82,7 @@ def flag_same_new_paths(file_infos_path, flagged_path):
             path to fileinfos
         flagged_path : str,
             the path where the flags will be saved (usually of the type `/file_infos/subdir/same_new_paths-[n].json`)
-    
+
     Saves
     --------
         flagged_path, json file
@@ -35,32 +91,84 @@ def flag_same_new_paths(file_infos_path, flagged_path):
     """
     with open(file_infos_path, 'r') as f:
         file_infos = json.load(f)
-    
-    visited = []
 
-    out_dict = {}
+    out_dict = group_same_new_paths(file_infos)
 
-    for file1 in file_infos.keys():
-        file1_duplicates_list = []
-        
+    out_dirs = '/'.join(flagged_path.split('/')[:-1])
+    os.makedirs(out_dirs, exist_ok=True)
+    with open(flagged_path, 'w') as f:
+        json.dump(out_dict, f, indent=4)
+
+def resolve_same_new_paths(file_infos_path, flagged_path, new_file_infos_path):
+    """
+    Same as `flag_same_new_paths` followed by `rename_duplicates`, reading the file infos only once
 
-        if file1 not in visited:            
-            for file2 in file_infos.keys():
+    **Overwrites any existing file in `flagged_path` and `new_file_infos_path`**
 
-                if file2 not in visited:
-                    condition1 = file_infos[file1]['new_path']==file_infos[file2]['new_path']
-                    if condition1:
-                        file1_duplicates_list.append(file2)
-                        visited.append(file2)
-            visited.append(file1)
-        if len(file1_duplicates_list)>1:
-            out_dict[file1] = file1_duplicates_list
-        del file1_duplicates_list
+    Package
+    ----
+    `utils.handle_duplicates.py`
+
+    Parameters
+    --------
+        file_infos_path : str,
+            path to fileinfos
+        flagged_path : str,
+            the path where the flags will be saved (usually of the type `/file_infos/subdir/same_new_paths-[n].json`)
+        new_file_infos_path : str,
+            path where the corrected file infos will be saved (can be the same as `file_infos_path`)
+
+    Saves
+    --------
+        flagged_path, json file
+            files with the same new path (see `flag_same_new_paths`)
+        new_file_infos_path, json file
+            file infos without two files having the same new path
+    """
+    with open(file_infos_path, 'r') as f:
+        file_infos = json.load(f)
+
+    flagged_dict = group_same_new_paths(file_infos)
 
     out_dirs = '/'.join(flagged_path.split('/')[:-1])
     os.makedirs(out_dirs, exist_ok=True)
     with open(flagged_path, 'w') as f:
-        json.dump(out_dict, f, indent=4)
+        json.dump(flagged_dict, f, indent=4)
+
+    new_file_infos = rename_same_new_paths(file_infos, flagged_dict)
+    with open(new_file_infos_path, 'w') as f:
+        json.dump(new_file_infos, f, indent=4)
+
+def get_duplicate_criteria(file_info):
+    """
+    Returns the keys under which a file is indexed when looking for potential duplicates, one per criterion
+    (same new path / same filename and functional task / same type, run, segmentation info, functional task and functional info),
+    each combined with the extension
+
+    Package
+    ----
+    `utils.handle_duplicates.py`
+
+    Parameters
+    --------
+        file_info : dict,
+            file infos of one file (see `utils.filename_reader.create_filename_dict`)
+
+    Returns
+    --------
+        criteria : list(tuple),
+            one hashable key per criterion, two files meet a criterion if they have the same key for it
+    """
+    filename = file_info['old_path'].split('/')[-1]
+    extension = extract_extension(filename)
+    seg_info = file_info.get('seg_info', '')
+    func_task = file_info.get('func_task', '')
+    func_info = file_info.get('func_info', '')
+    return [
+        (1, file_info['new_path'], extension),
+        (2, filename, func_task, extension),
+        (3, file_info['type'], file_info['run'], seg_info, func_task, func_info, extension)
+    ]
 
 def flag_potential_duplicates(file_infos_path, flagged_path):
     """
@@ -87,70 +195,32 @@ def flag_potential_duplicates(file_infos_path, flagged_path):
     """
     with open(file_infos_path, 'r') as f:
         file_infos = json.load(f)
+
+    files = list(file_infos.keys())
     
-    visited = []
+    # each file is only compared with the files sharing one of its criteria (see get_duplicate_criteria),
+    # the buckets list the indices of the non temporary files in the order of file_infos
+    buckets = {}
+    files_criteria = []
+    for idx, file in enumerate(files):
+        criteria = get_duplicate_criteria(file_infos[file])
+        files_criteria.append(criteria)
+        if not file_infos[file].get('is_tmp', False):
+            for criterion in criteria:
+                buckets.setdefault(criterion, []).append(idx)
 
     out_dict = {}
 
-    for file1 in file_infos.keys():
-        file1_duplicates_list = []
-        filename1 = file_infos[file1]['old_path'].split('/')[-1]
-        type1 = file_infos[file1]['type']
-        run1 = file_infos[file1]['run']
-
-        extension1 = extract_extension(filename1)
-        try:
-            is_tmp1 = file_infos[file1]['is_tmp']
-        except:
-            is_tmp1 = False
-        try:
-            seg_info1 = file_infos[file1]['seg_info']
-        except:
-            seg_info1 = ''
-        try:
-            func_task1 = file_infos[file1]['func_task']
-        except:
-            func_task1 = ''
-        try:
-            func_info1 = file_infos[file1]['func_info']
-        except:
-            func_info1 = ''
-
-        if file1 not in visited and (not is_tmp1):
-            for file2 in file_infos.keys():
-                filename2 = file_infos[file2]['old_path'].split('/')[-1]
-                type2 = file_infos[file2]['type']
-                run2 = file_infos[file2]['run']
-                extension2 = extract_extension(filename2)
-                try:
-                    is_tmp2 = file_infos[file2]['is_tmp']
-                except:
-                    is_tmp2 = False
-                try:
-                    seg_info2 = file_infos[file2]['seg_info']
-                except:
-                    seg_info2 = ''
-                try:
-                    func_task2 = file_infos[file2]['func_task']
-                except:
-                    func_task2 = ''
-                try:
-                    func_info2 = file_infos[file2]['func_info']
-                except:
-                    func_info2 = ''
-
-                if file2 not in visited and (not is_tmp2):
-                    condition1 = file_infos[file1]['new_path']==file_infos[file2]['new_path']
-                    condition2 = filename1 == filename2 and func_task1 == func_task2
-                    condition3 = (type1==type2) and (run1==run2) and (seg_info1==seg_info2) and (func_task1==func_task2) and (func_info1==func_info2)
-
-                    if (condition1 or condition2 or condition3) and (extension1==extension2) and (type1 not in ['code', 'misc', 'modelling', 'misc_derivative']):
-                        file1_duplicates_list.append(file2)
-                        #visited.append(file2)
-            visited.append(file1)
-        if len(file1_duplicates_list)>1:
-            out_dict[file1] = file1_duplicates_list
-        del file1_duplicates_list
+    for idx1, file1 in enumerate(files):
+        if file_infos[file1].get('is_tmp', False) or file_infos[file1]['type'] in ['code', 'misc', 'modelling', 'misc_derivative']:
+            continue
+        # the files before file1 were already compared with it
+        file1_duplicates_idx = set()
+        for criterion in files_criteria[idx1]:
+            bucket = buckets[criterion]
+            file1_duplicates_idx.update(bucket[bisect_left(bucket, idx1):])
+        if len(file1_duplicates_idx)>1:
+            out_dict[file1] = [files[idx2] for idx2 in sorted(file1_duplicates_idx)]
 
     out_dirs = '/'.join(flagged_path.split('/')[:-1])
     os.makedirs(out_dirs, exist_ok=True)
@@ -183,26 +253,286 @@ def rename_duplicates(file_infos_path, flagged_path, new_file_infos_path):
     """
     with open(file_infos_path, 'r') as f:
         file_infos = json.load(f)
-    new_file_infos = file_infos.copy()
-    
+
     with open(flagged_path, 'r') as f:
         flagged_dict = json.load(f)
-    
-    for key in flagged_dict.keys():
-        #print('key',key)
-        for i, file in enumerate(flagged_dict[key]):
-            #print('file',file)
 
-            original_new_path = file_infos[file]['new_path']
-            final_new_path = remove_extension(original_new_path) + '_duplicate-' + str(i) + extract_extension(original_new_path)
-            #print('original', original_new_path)
-            #print('final', final_new_path)
-            new_file_infos[file]['new_path'] = final_new_path
-    
+    new_file_infos = rename_same_new_paths(file_infos, flagged_dict)
+
     with open(new_file_infos_path, 'w') as f:
-        json.dump(file_infos, f, indent=4)
-    
-def compare_potential_duplicates(flagged_path, actual_duplicates_path, not_downloaded_path, TOKEN, verbose=True, debug=False):
+        json.dump(new_file_infos, f, indent=4)
+
+def get_file_record(dbx, path, file_metadata):
+    """
+    Returns the size, content hash and revision of a file in the source directory, read from the metadata saved with the file list if possible,
+    otherwise requested to Dropbox
+
+    Package
+    ----
+    `utils.handle_duplicates.py`
+
+    Parameters
+    --------
+        dbx : dropbox.Dropbox,
+            authenticated Dropbox client
+        path : str,
+            path of the file (without '/source')
+        file_metadata : dict,
+            metadata saved with the file list (see `utils.save_logs.read_file_metadata`)
+
+    Returns
+    --------
+        record : dict,
+            with keys 'size' (in bytes), 'content_hash' and 'rev'
+    """
+    record = file_metadata.get(path, {})
+    if all(record.get(key) is not None for key in ['size', 'content_hash', 'rev']):
+        return record
+    metadata = dbx.files_get_metadata('/source' + path)
+    return {
+        'size': metadata.size,
+        'content_hash': metadata.content_hash,
+        'rev': metadata.rev
+    }
+
+def compare_group_by_content_hash(dbx, group, file_metadata, debug=False):
+    """
+    Compares the first file of a group of potential duplicates with the others using the Dropbox content hashes,
+    without downloading anything (so there is no maximal file size)
+
+    Package
+    ----
+    `utils.handle_duplicates.py`
+
+    Parameters
+    --------
+        dbx : dropbox.Dropbox,
+            authenticated Dropbox client
+        group : list(str),
+            paths (without '/source') of the potential duplicates, the first one being compared with the others
+        file_metadata : dict,
+            metadata saved with the file list (see `utils.save_logs.read_file_metadata`)
+        debug : bool, default: False
+            set to True to print steps while debugging
+
+    Returns
+    --------
+        duplicates : list(str) or None,
+            the first path followed by the paths having the same content, None if the first file could not be compared
+        not_compared : dict,
+            files whose content hash could not be read, in the same format as `not_downloaded_path`
+        eliminated : collections.Counter,
+            number of files found different from the first one, by criterion ('size', 'content_hash')
+    """
+    not_compared = {}
+    eliminated = Counter()
+    try:
+        file1 = get_file_record(dbx, group[0], file_metadata)
+    except:
+        not_compared[group[0]] = {
+            'old_path': group[0]
+        }
+        return None, not_compared, eliminated
+
+    duplicates = [group[0]]
+    for path2 in group[1:]:
+        try:
+            file2 = get_file_record(dbx, path2, file_metadata)
+        except:
+            not_compared[path2] = {
+                'old_path': path2
+            }
+            continue
+        if file1['size'] != file2['size']:
+            eliminated['size'] += 1
+        elif file1['content_hash'] != file2['content_hash']:
+            eliminated['content_hash'] += 1
+        else:
+            if debug:
+                print(group[0] + '\n    is the same as: \n' + path2)
+            duplicates.append(path2)
+    return duplicates, not_compared, eliminated
+
+def iter_file_blocks(dbx, path, record, block_size=COMPARISON_BLOCK_SIZE, cache=None):
+    """
+    Returns a generator of the content of a file in the source directory, in blocks of `block_size` bytes,
+    streamed from Dropbox (or read from `cache` if the file was already downloaded)
+
+    Package
+    ----
+    `utils.handle_duplicates.py`
+
+    Parameters
+    --------
+        dbx : dropbox.Dropbox,
+            authenticated Dropbox client
+        path : str,
+            path of the file (without '/source')
+        record : dict,
+            size and revision of the file (see `get_file_record`)
+        block_size : int, default: COMPARISON_BLOCK_SIZE
+            size of the blocks in bytes (see `utils/globals.py`)
+        cache : utils.download_cache.DownloadCache, default: None
+            cache of the downloaded files, the files are only streamed if None
+    """
+    if cache is not None:
+        return cache.iter_blocks(dbx, '/source' + path, record['rev'], record['size'], block_size)
+    return iter_download_blocks(dbx, '/source' + path, block_size, record['rev'])
+
+def compare_blocks(blocks1, blocks2):
+    """
+    Compares the content of two files given as generators of blocks (see `iter_file_blocks`),
+    stops at the first different block so that the rest of the files is not downloaded
+
+    Package
+    ----
+    `utils.handle_duplicates.py`
+
+    Parameters
+    --------
+        blocks1, blocks2 : generator(bytes),
+            blocks of the same size of both files
+
+    Returns
+    --------
+        identical : bool,
+            True if both files have the same content
+    """
+    try:
+        for block1 in blocks1:
+            if block1 != next(blocks2, None):
+                return False
+        return next(blocks2, None) is None
+    finally:
+        blocks1.close()
+        blocks2.close()
+
+def get_fingerprint(dbx, path, record, fingerprint_size=FINGERPRINT_SIZE, cache=None):
+    """
+    Returns a hash of the first and last `fingerprint_size` bytes of a file in the source directory,
+    downloaded with HTTP range requests (or read from `cache` if the file was already downloaded)
+
+    Package
+    ----
+    `utils.handle_duplicates.py`
+
+    Parameters
+    --------
+        dbx : dropbox.Dropbox,
+            authenticated Dropbox client
+        path : str,
+            path of the file (without '/source')
+        record : dict,
+            size and revision of the file (see `get_file_record`)
+        fingerprint_size : int, default: FINGERPRINT_SIZE
+            number of bytes read at the beginning and at the end of the file (see `utils/globals.py`)
+        cache : utils.download_cache.DownloadCache, default: None
+            cache of the downloaded files
+
+    Returns
+    --------
+        fingerprint : str,
+            sha256 of the head and tail of the file
+    """
+    size = record['size']
+    ranges = [(0, min(fingerprint_size, size)), (max(size - fingerprint_size, 0), size)]
+    fingerprint = hashlib.sha256()
+    if cache is not None:
+        contents = cache.read_ranges('/source' + path, record['rev'], ranges)
+        if contents is not None:
+            for content in contents:
+                fingerprint.update(content)
+            return fingerprint.hexdigest()
+    for start, end in ranges:
+        _, response = dbx.files_download('/source' + path, rev=record['rev'], extra_headers={'Range': 'bytes=' + str(start) + '-' + str(end - 1)})
+        try:
+            fingerprint.update(response.content)
+        finally:
+            response.close()
+    return fingerprint.hexdigest()
+
+def compare_group_by_download(dbx, group, file_metadata, debug=False, cache=None):
+    """
+    Compares the first file of a group of potential duplicates with the others, with filters of increasing cost:
+    the sizes (from the metadata), then the first and last bytes (see `get_fingerprint`),
+    and finally the whole content downloaded block by block (see `compare_blocks`)
+
+    Package
+    ----
+    `utils.handle_duplicates.py`
+
+    Parameters
+    --------
+        dbx : dropbox.Dropbox,
+            authenticated Dropbox client
+        group : list(str),
+            paths (without '/source') of the potential duplicates, the first one being compared with the others
+        file_metadata : dict,
+            metadata saved with the file list (see `utils.save_logs.read_file_metadata`)
+        debug : bool, default: False
+            set to True to print steps while debugging
+        cache : utils.download_cache.DownloadCache, default: None
+            cache of the downloaded files, the files are only streamed if None
+
+    Returns
+    --------
+        duplicates : list(str) or None,
+            the first path followed by the paths having the same content, None if the first file could not be compared
+        not_compared : dict,
+            files that could not be compared, in the same format as `not_downloaded_path`
+        eliminated : collections.Counter,
+            number of files found different from the first one, by filter ('size', 'head_tail', 'full')
+    """
+    not_compared = {}
+    eliminated = Counter()
+    try:
+        file1 = get_file_record(dbx, group[0], file_metadata)
+    except:
+        not_compared[group[0]] = {
+            'old_path': group[0]
+        }
+        return None, not_compared, eliminated
+
+    # the fingerprint of the first file is only downloaded if a file with the same size is found
+    fingerprint1 = None
+    duplicates = [group[0]]
+    for path2 in group[1:]:
+        if debug:
+            print(group[0])
+            print(path2)
+        file2 = None
+        try:
+            file2 = get_file_record(dbx, path2, file_metadata)
+            if file1['size'] != file2['size']:
+                eliminated['size'] += 1
+                continue
+            # the fingerprint would be as long to download as the whole files for small files
+            if file1['size'] > 2 * FINGERPRINT_SIZE:
+                if fingerprint1 is None:
+                    fingerprint1 = get_fingerprint(dbx, group[0], file1, cache=cache)
+                if fingerprint1 != get_fingerprint(dbx, path2, file2, cache=cache):
+                    eliminated['head_tail'] += 1
+                    continue
+            comp = compare_blocks(
+                iter_file_blocks(dbx, group[0], file1, cache=cache),
+                iter_file_blocks(dbx, path2, file2, cache=cache)
+            )
+        except:
+            not_compared[path2] = {
+                'old_path': path2
+            }
+            if file2 is not None:
+                not_compared[path2]['size'] = file2['size']
+            continue
+        if comp:
+            if debug:
+                print(group[0] + '\n    is the same as: \n' + path2)
+            duplicates.append(path2)
+        else:
+            eliminated['full'] += 1
+    return duplicates, not_compared, eliminated
+
+def compare_potential_duplicates(flagged_path, actual_duplicates_path, not_downloaded_path, TOKEN, verbose=True, debug=False, file_list_path=None, method='download', workers=8, cache_dir=DOWNLOAD_CACHE_DIR):
     """
     Compares potential duplicates in `flagged_path` and saves a json in `actual_duplicates_path` showing all the actual duplicates it has found, 
     and one in `not_downloaded_path` for the files it couldn't download (and that were not compared consequentially)
@@ -220,37 +550,33 @@ def compare_potential_duplicates(flagged_path, actual_duplicates_path, not_downl
         actual_duplicates_path : str,
             path to the actual duplicates found
         not_downloaded_path : str,
-            path to the json containing the files that could not be downloaded (contains the maximal file size set in utils.handle_duplicates and the size of the files)
+            path to the json containing the files that could not be downloaded (with their size when it is known)
         TOKEN : str,
             access token for the Dropbox API
         verbose : bool, default: True,
-            prints info on the dropbox authentication if set to True
+            prints info on the dropbox authentication, and the number of files eliminated by each filter, if set to True
         debug : bool, default: False
             set to True to print steps while debugging
+        file_list_path : str, default: None
+            path to the saved file list, whose metadata is used for the file sizes instead of requesting them to Dropbox
+        method : str, default: 'download'
+            'download' downloads the files with the same size and compares them block by block (see `compare_group_by_download`),
+            'content_hash' compares the Dropbox content hashes without downloading anything
+        workers : int, default: 8
+            number of groups of potential duplicates compared concurrently, `workers=1` compares them one after another
+        cache_dir : str, default: DOWNLOAD_CACHE_DIR
+            directory of the download cache (see `utils.download_cache.DownloadCache`), used with method='download' so that
+            each file is downloaded only once, the files are only streamed if None
     
     Saves
     --------
         actual_duplicates_path : str,
             path to the actual duplicates found
         not_downloaded_path : str,
-            path to the json containing the files that could not be downloaded (contains the maximal file size set in utils.handle_duplicates and the size of the files)
+            path to the json containing the files that could not be downloaded (with their size when it is known)
     """
-    if (len(TOKEN) == 0):
-        sys.exit("ERROR: Looks like you didn't add your access token.")
-        # Create an instance of a Dropbox class, which can make requests to the API.
-    if verbose: 
-        print("Creating a Dropbox object...")
-    with dropbox.Dropbox(TOKEN) as dbx:
-        # Check that the access token is valid
-        try:
-            dbx.users_get_current_account()
-            if verbose:
-                print('Access token is valid')
-        except AuthError:
-            sys.exit("ERROR: Invalid access token; try re-generating an "
-                "access token from the app console on the web.")
-    
-    os.makedirs('tmp_dir', exist_ok=True)
+    # the downloads may take longer than the other requests
+    dbx = get_dropbox_client(TOKEN, verbose, timeout=DROPBOX_TRANSFER_TIMEOUT if method == 'download' else None)
     
     if os.path.exists(actual_duplicates_path):
         with open(actual_duplicates_path, 'r') as f:
@@ -261,102 +587,65 @@ def compare_potential_duplicates(flagged_path, actual_duplicates_path, not_downl
         with open(not_downloaded_path, 'r') as f:
             not_downloaded = json.load(f)
     else:
-        not_downloaded = {
-            "max_size (in octets)": MAX_FILE_SIZE_FOR_COMPARISON
-        }
+        not_downloaded = {}
 
     with open(flagged_path, 'r') as f:
         flagged_duplicates = json.load(f)
 
-    for key in tqdm(flagged_duplicates.keys()):
-        n = len(flagged_duplicates[key])
-        if debug:
-            print('comparing potential duplicates for ' + key)
-
-        from_path1 = '/source' + flagged_duplicates[key][0]
-        from_path1_without_source = flagged_duplicates[key][0]
-        to_path1 = 'tmp_dir/file1' + extract_extension(from_path1)
-
-        clean_up_tmpdir(debug)
-
-        downloaded1 = False
-
-        if key not in actual_duplicates.keys():
-            to_skip = False
-            file1_size = None
-            try:
-                file1_size = dbx.files_get_metadata(from_path1).size
-                assert file1_size <= MAX_FILE_SIZE_FOR_COMPARISON
-                dbx.files_download_to_file(to_path1, from_path1)
-                downloaded1 = True
-            except:
-                if file1_size is not None:
-                    not_downloaded[from_path1_without_source] = {
-                        'old_path': from_path1_without_source,
-                        'size': file1_size
-                    }
-                else:
-                    not_downloaded[from_path1_without_source] = {
-                        'old_path': from_path1_without_source
-                    }
+    if file_list_path is not None:
+        file_metadata = read_file_metadata(file_list_path)
+    else:
+        file_metadata = {}
 
-        else:
-            to_skip = True
-
-        if downloaded1 and (not to_skip):
-            actual_duplicates[from_path1_without_source] = [from_path1_without_source]
-            for file2_idx in range(1, n):
-                from_path2 = '/source' + flagged_duplicates[key][file2_idx]
-                from_path2_without_source = flagged_duplicates[key][file2_idx]
-                to_path2 = 'tmp_dir/file2' + extract_extension(from_path2)
-                if debug:    
-                    print(from_path1)
-                    print(from_path2)
-                
-                try:
-                    file2_size = dbx.files_get_metadata(from_path2).size
-                    assert file2_size <= MAX_FILE_SIZE_FOR_COMPARISON
-                    if file1_size == file2_size:
-                        dbx.files_download_to_file(to_path2, from_path2)
-                        downloaded2 = True
-                    else:
-                        downloaded2=False
-                except:
-                    downloaded2 = False
-                    not_downloaded[from_path2_without_source] = {
-                            'old_path': from_path2_without_source,
-                            'size': file2_size
-                        }
-                
-                if downloaded2 and file1_size == file2_size:
-                    try:
-                        comp = filecmp.cmp(to_path1, to_path2, shallow=False)
-                    except:
-                        comp=False
-                        print(from_path1 + ' not compared')
-                    if comp:
-                        if debug:
-                            print(from_path1 + '\n    is the same as: \n' + from_path2)
-                        actual_duplicates[from_path1_without_source].append(from_path2_without_source)
-            with open(actual_duplicates_path, 'w') as f:
-                json.dump(actual_duplicates, f, indent=4)
-            
-            with open(not_downloaded_path, 'w') as f:
-                json.dump(not_downloaded, f, indent=4)
+    if method == 'content_hash':
+        compare_group = compare_group_by_content_hash
+    else:
+        cache = DownloadCache(cache_dir) if cache_dir is not None else None
+        compare_group = partial(compare_group_by_download, cache=cache)
+
+    # the groups are compared concurrently, the results are merged (and saved) by this thread only, in the order of flagged_duplicates
+    keys = [key for key in flagged_duplicates.keys() if key not in actual_duplicates.keys()]
+    eliminated = Counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(compare_group, dbx, flagged_duplicates[key], file_metadata, debug) for key in keys]
+        try:
+            for key, future in tqdm(zip(keys, futures), total=len(keys)):
+                if debug:
+                    print('compared potential duplicates for ' + key)
+                duplicates, not_compared, group_eliminated = future.result()
+                not_downloaded.update(not_compared)
+                eliminated.update(group_eliminated)
+
+                if duplicates is not None:
+                    actual_duplicates[flagged_duplicates[key][0]] = duplicates
+                    with open(actual_duplicates_path, 'w') as f:
+                        json.dump(actual_duplicates, f, indent=4)
+                    
+                    with open(not_downloaded_path, 'w') as f:
+                        json.dump(not_downloaded, f, indent=4)
+        finally:
+            # stops the remaining comparisons if the loop is interrupted
+            executor.shutdown(wait=True, cancel_futures=True)
 
     with open(actual_duplicates_path, 'w') as f:
         json.dump(actual_duplicates, f, indent=4)
     
     with open(not_downloaded_path, 'w') as f:
         json.dump(not_downloaded, f, indent=4)
-    clean_up_tmpdir()
+
+    if verbose:
+        print('files found different from the first file of their group, by filter: ' + str(dict(eliminated)))
 
 def regroup_actual_duplicates(actual_duplicates_path, new_duplicates_path, debug=False):
     """
-    Removes redundancy in the flagged duplicates
+    Removes redundancy in the flagged duplicates: the groups sharing a file are merged, so that each file is in a single group
+    (duplicates are transitive, e.g. file1 ~ file2 under the key file1 and file2 ~ file3 under the key file2 gives one group file1, file2, file3)
+
+    The groups do not depend on the order of `actual_duplicates_path`, and in each group the files keep the order in which they first appear in it,
+    the first file (the one kept by `handle_duplicates_in_file_infos`) being the key
 
     **Overwrites file infos in `new_duplicates_path`**
-    
+
     Package
     ----
     `utils.handle_duplicates.py`
@@ -369,7 +658,7 @@ def regroup_actual_duplicates(actual_duplicates_path, new_duplicates_path, debug
             path to the new file
         debug : bool,
             set to true for debugging
-    
+
     Saves
     --------
         new_duplicates_path, json file
@@ -377,19 +666,36 @@ def regroup_actual_duplicates(actual_duplicates_path, new_duplicates_path, debug
     """
     with open(actual_duplicates_path, 'r') as f:
         actual_duplicates = json.load(f)
-    
-    for file1 in actual_duplicates.keys():
-        if len(actual_duplicates[file1]) > 1 :
-            for subfile1 in actual_duplicates[file1][1:]:
-                if subfile1 in actual_duplicates.keys():
-                    for subfile1_duplicate in actual_duplicates[subfile1]:
-                        if subfile1_duplicate not in actual_duplicates[file1]:
-                            actual_duplicates[file1].append(subfile1_duplicate)
-                        actual_duplicates[subfile1] = 'to_remove'
+
+    # disjoint sets of duplicates: each file points to a file of its group, the root of a group being its first file
+    parent = {}
+    order = {}
+
+    def find(file):
+        root = file
+        while parent[root] != root:
+            root = parent[root]
+        while parent[file] != root:
+            parent[file], file = root, parent[file]
+        return root
+
+    for file1, duplicates in actual_duplicates.items():
+        for file in [file1] + duplicates:
+            if file not in parent:
+                parent[file] = file
+                order[file] = len(order)
+        for file2 in duplicates:
+            root1, root2 = find(file1), find(file2)
+            if root1 != root2:
+                if order[root2] < order[root1]:
+                    root1, root2 = root2, root1
+                parent[root2] = root1
+                if debug:
+                    print('merging the duplicates of ' + root2 + ' with the duplicates of ' + root1)
+
     new_duplicates = {}
-    for key in actual_duplicates.keys():
-        if actual_duplicates[key] != 'to_remove':
-            new_duplicates[key] = actual_duplicates[key]
+    for file in order.keys():
+        new_duplicates.setdefault(find(file), []).append(file)
     with open(new_duplicates_path, 'w') as f:
         json.dump(new_duplicates, f, indent=4)
 
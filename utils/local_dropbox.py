@@ -0,0 +1,463 @@
+"""
+Storage backend reproducing the part of the Dropbox API used by the scripts, on a local directory
+
+The storage backend interface is the subset of `dropbox.Dropbox` methods used in `utils`:
+ - listing: `files_list_folder`, `files_list_folder_continue`
+ - metadata: `files_get_metadata`
+ - download: `files_download` (with a `Range` header in `extra_headers`), `files_download_to_file`
+ - copy: `files_copy`, `files_copy_v2`, `files_copy_batch_v2`, `files_copy_batch_check_v2`
+ - upload sessions: `files_upload`, `files_upload_session_start`, `files_upload_session_append`, `files_upload_session_finish`
+
+`LocalDropbox` implements it with the same return types and errors as the Dropbox SDK,
+with configurable latency, bandwidth and rate limit, so that the throughput of the scripts can be
+measured offline (see `utils.dropbox_client.set_storage_backend`)
+"""
+
+import collections
+import datetime
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+from dropbox.exceptions import ApiError, RateLimitError
+from stone.backends.python_rsrc.stone_base import NOT_SET
+from dropbox.files import (
+    DeletedMetadata, DownloadError, FileMetadata, FolderMetadata, GetMetadataError, ListFolderContinueError,
+    ListFolderError, ListFolderResult, LookupError, RelocationBatchErrorEntry, RelocationBatchResultEntry,
+    RelocationBatchV2JobStatus, RelocationBatchV2Launch, RelocationBatchV2Result, RelocationError, RelocationResult, UploadError,
+    UploadSessionAppendError, UploadSessionFinishError, UploadSessionLookupError, UploadSessionOffsetError,
+    UploadSessionStartResult, UploadWriteFailed, WriteConflictError, WriteError
+)
+
+DROPBOX_HASH_BLOCK_SIZE = 4 * 1024 * 1024
+
+
+def dropbox_content_hash(file_path):
+    """
+    Returns the Dropbox content hash of a local file (sha256 of the concatenated sha256 of each 4MB block),
+    i.e. the `content_hash` that Dropbox would give to this file
+
+    Package
+    ----
+    `utils.local_dropbox.py`
+
+    Parameters
+    --------
+        file_path : str,
+            path to a local file
+
+    Returns
+    --------
+        content_hash : str,
+            hexadecimal digest
+    """
+    block_hashes = b''
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(DROPBOX_HASH_BLOCK_SIZE)
+            if not block:
+                break
+            block_hashes += hashlib.sha256(block).digest()
+    return hashlib.sha256(block_hashes).hexdigest()
+
+
+class LocalFileMetadata(FileMetadata):
+    """
+    `dropbox.files.FileMetadata` whose `content_hash` is only computed when it is read (and then kept),
+    so that listing a local tree does not read all its files
+
+    Package
+    ----
+    `utils.local_dropbox.py`
+    """
+    __slots__ = ['_backend', '_local_path', '_stat']
+
+    @property
+    def content_hash(self):
+        if self._content_hash_value is NOT_SET:
+            self._content_hash_value = self._backend._content_hash(self._local_path, self._stat)
+        return self._content_hash_value
+
+
+class LocalDownloadResponse:
+    """
+    Minimal equivalent of the `requests.Response` returned by `dropbox.Dropbox.files_download`,
+    streaming a local file (or a range of it)
+
+    Package
+    ----
+    `utils.local_dropbox.py`
+    """
+
+    def __init__(self, backend, local_path, start, end):
+        self.backend = backend
+        self.status_code = 200 if start == 0 and end == os.path.getsize(local_path) else 206
+        self.headers = {'Content-Length': str(end - start)}
+        self._f = open(local_path, 'rb')
+        self._f.seek(start)
+        self._remaining = end - start
+
+    def iter_content(self, chunk_size=1):
+        while self._remaining > 0:
+            chunk = self._f.read(min(chunk_size, self._remaining))
+            if not chunk:
+                break
+            self._remaining -= len(chunk)
+            self.backend._transfer(len(chunk), 'bytes_downloaded')
+            yield chunk
+        self.close()
+
+    @property
+    def content(self):
+        return b''.join(self.iter_content(DROPBOX_HASH_BLOCK_SIZE))
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class LocalDropbox:
+    """
+    In-process fake of `dropbox.Dropbox`, storing the files in a local directory (see the module docstring)
+
+    Package
+    ----
+    `utils.local_dropbox.py`
+
+    Parameters
+    --------
+        root : str,
+            local directory playing the role of the Dropbox app folder (e.g. containing `source/` and `target/`)
+        latency=0 : float,
+            time (in seconds) added to every call, to simulate the round trip to the Dropbox servers
+        bandwidth=None : float,
+            bytes per second for each download / upload stream, unlimited if None
+        max_calls_per_second=None : float,
+            calls above this rate wait until they are allowed, unlimited if None
+        max_retries_on_rate_limit=None : int,
+            as in `dropbox.Dropbox`: number of times a rate limited call waits and is retried before
+            raising `dropbox.exceptions.RateLimitError`, unlimited if None
+        page_size=1000 : int,
+            default number of entries per listing page
+
+    Attributes
+    --------
+        stats : collections.Counter,
+            number of calls per method, 'bytes_downloaded' / 'bytes_uploaded',
+            and 'rate_limited' / 'rate_limit_wait' (number of waits for the rate limit / total time waited, in seconds)
+    """
+
+    def __init__(self, root, latency=0, bandwidth=None, max_calls_per_second=None, page_size=1000, max_retries_on_rate_limit=None):
+        self.root = os.path.abspath(root)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.max_calls_per_second = max_calls_per_second
+        self.max_retries_on_rate_limit = max_retries_on_rate_limit
+        self.page_size = page_size
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+        self._recent_calls = collections.deque()
+        self._cursors = {}
+        self._upload_sessions = {}
+        self._content_hashes = {}
+        self._copy_jobs = {}
+
+    # -------------------------------------------------------------------------------------------------
+    # simulated network
+
+    def _call(self, method):
+        with self._lock:
+            self.stats[method] += 1
+        # like the Dropbox SDK, a rate limited call waits for the backoff and is retried
+        retries = 0
+        backoff = self._rate_limit_backoff()
+        while backoff is not None:
+            if self.max_retries_on_rate_limit is not None and retries >= self.max_retries_on_rate_limit:
+                raise RateLimitError('local', backoff=backoff)
+            with self._lock:
+                self.stats['rate_limited'] += 1
+                self.stats['rate_limit_wait'] += backoff
+            time.sleep(backoff)
+            retries += 1
+            backoff = self._rate_limit_backoff()
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _rate_limit_backoff(self):
+        # records the call and returns None if it is allowed by max_calls_per_second,
+        # returns the time (in seconds) until it is allowed otherwise
+        if self.max_calls_per_second is None:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            while self._recent_calls and now - self._recent_calls[0] >= 1:
+                self._recent_calls.popleft()
+            if len(self._recent_calls) >= self.max_calls_per_second:
+                return 1 - (now - self._recent_calls[0])
+            self._recent_calls.append(now)
+            return None
+
+    def _transfer(self, n_bytes, stat):
+        with self._lock:
+            self.stats[stat] += n_bytes
+        if self.bandwidth:
+            time.sleep(n_bytes / self.bandwidth)
+
+    def _error(self, error):
+        return ApiError('local', error, None, None)
+
+    # -------------------------------------------------------------------------------------------------
+    # paths and metadata
+
+    def _local_path(self, path):
+        if path in ['', '/']:
+            return self.root
+        return os.path.join(self.root, *path.strip('/').split('/'))
+
+    def _metadata(self, path):
+        local_path = self._local_path(path)
+        path_display = '/' + path.strip('/')
+        name = path_display.split('/')[-1]
+        if os.path.isdir(local_path):
+            return FolderMetadata(name=name, id='id:' + str(os.stat(local_path).st_ino),
+                                  path_lower=path_display.lower(), path_display=path_display)
+        stat = os.stat(local_path)
+        modified = datetime.datetime.fromtimestamp(int(stat.st_mtime))
+        metadata = LocalFileMetadata(
+            name=name,
+            id='id:' + str(stat.st_ino),
+            client_modified=modified,
+            server_modified=modified,
+            rev=format(stat.st_mtime_ns, '016x'),
+            size=stat.st_size,
+            path_lower=path_display.lower(),
+            path_display=path_display
+        )
+        # the content hash is computed on the first read of metadata.content_hash (see `LocalFileMetadata`)
+        metadata._backend = self
+        metadata._local_path = local_path
+        metadata._stat = stat
+        return metadata
+
+    def _content_hash(self, local_path, stat):
+        key = (local_path, stat.st_mtime_ns, stat.st_size)
+        if key not in self._content_hashes:
+            self._content_hashes[key] = dropbox_content_hash(local_path)
+        return self._content_hashes[key]
+
+    def _list(self, path, recursive):
+        entries = []
+        local_dir = self._local_path(path)
+        for name in sorted(os.listdir(local_dir)):
+            entry = self._metadata(path.rstrip('/') + '/' + name)
+            entries.append(entry)
+            if recursive and isinstance(entry, FolderMetadata):
+                entries += self._list(entry.path_display, True)
+        return entries
+
+    def users_get_current_account(self):
+        self._call('users_get_current_account')
+
+    def files_get_metadata(self, path, **kwargs):
+        self._call('files_get_metadata')
+        if not os.path.exists(self._local_path(path)):
+            raise self._error(GetMetadataError.path(LookupError.not_found))
+        return self._metadata(path)
+
+    # -------------------------------------------------------------------------------------------------
+    # listing
+
+    def _page(self, cursor_id, start, limit):
+        state = self._cursors[cursor_id]
+        entries = state['entries'][start:start + limit]
+        end = start + len(entries)
+        return ListFolderResult(entries=entries, cursor=cursor_id + ':' + str(end), has_more=end < len(state['entries']))
+
+    def _new_cursor(self, path, recursive, entries, limit, snapshot):
+        with self._lock:
+            cursor_id = str(len(self._cursors))
+            self._cursors[cursor_id] = {
+                'path': path,
+                'recursive': recursive,
+                'entries': entries,
+                'limit': limit,
+                'snapshot': snapshot
+            }
+        return cursor_id
+
+    def files_list_folder(self, path, recursive=False, limit=None, **kwargs):
+        self._call('files_list_folder')
+        if not os.path.isdir(self._local_path(path)):
+            raise self._error(ListFolderError.path(LookupError.not_found))
+        limit = limit or self.page_size
+        entries = self._list(path, recursive)
+        snapshot = {entry.path_lower: entry for entry in entries}
+        if recursive and path not in ['', '/']:
+            entries = [self._metadata(path)] + entries
+        return self._page(self._new_cursor(path, recursive, entries, limit, snapshot), 0, limit)
+
+    def files_list_folder_continue(self, cursor):
+        self._call('files_list_folder_continue')
+        try:
+            cursor_id, start = cursor.split(':')
+            state = self._cursors[cursor_id]
+        except (ValueError, KeyError):
+            raise self._error(ListFolderContinueError.reset)
+        start = int(start)
+        if start < len(state['entries']):
+            return self._page(cursor_id, start, state['limit'])
+
+        # listing complete: returns the changes since the snapshot
+        old = state['snapshot']
+        new = {entry.path_lower: entry for entry in self._list(state['path'], state['recursive'])}
+        changes = [DeletedMetadata(name=old[path].name, path_lower=path, path_display=old[path].path_display)
+                   for path in old if path not in new]
+        for path, entry in new.items():
+            if path not in old or (isinstance(entry, FileMetadata) and entry.rev != old[path].rev):
+                changes.append(entry)
+        cursor_id = self._new_cursor(state['path'], state['recursive'], changes, state['limit'], new)
+        return self._page(cursor_id, 0, state['limit'])
+
+    # -------------------------------------------------------------------------------------------------
+    # download
+
+    def files_download(self, path, rev=None, extra_headers=None):
+        self._call('files_download')
+        local_path = self._local_path(path)
+        if not os.path.isfile(local_path):
+            raise self._error(DownloadError.path(LookupError.not_found))
+        size = os.path.getsize(local_path)
+        start, end = 0, size
+        if extra_headers and 'Range' in extra_headers:
+            first, last = extra_headers['Range'].split('=')[1].split('-')
+            if first == '':
+                start = max(size - int(last), 0)
+            else:
+                start = int(first)
+                end = min(int(last) + 1, size) if last != '' else size
+        return self._metadata(path), LocalDownloadResponse(self, local_path, start, end)
+
+    def files_download_to_file(self, download_path, path, rev=None):
+        metadata, response = self.files_download(path, rev)
+        with open(download_path, 'wb') as f:
+            for chunk in response.iter_content(DROPBOX_HASH_BLOCK_SIZE):
+                f.write(chunk)
+        return metadata
+
+    # -------------------------------------------------------------------------------------------------
+    # copy
+
+    def _copy(self, from_path, to_path):
+        local_from = self._local_path(from_path)
+        local_to = self._local_path(to_path)
+        if not os.path.exists(local_from):
+            raise self._error(RelocationError.from_lookup(LookupError.not_found))
+        if os.path.exists(local_to):
+            raise self._error(RelocationError.to(WriteError.conflict(WriteConflictError.file)))
+        os.makedirs(os.path.dirname(local_to), exist_ok=True)
+        if os.path.isdir(local_from):
+            shutil.copytree(local_from, local_to)
+        else:
+            shutil.copy2(local_from, local_to)
+        return self._metadata(to_path)
+
+    def files_copy(self, from_path, to_path, **kwargs):
+        self._call('files_copy')
+        return self._copy(from_path, to_path)
+
+    def files_copy_v2(self, from_path, to_path, **kwargs):
+        self._call('files_copy_v2')
+        return RelocationResult(metadata=self._copy(from_path, to_path))
+
+    def _run_copy_batch(self, async_job_id, entries):
+        results = []
+        for entry in entries:
+            try:
+                results.append(RelocationBatchResultEntry.success(self._copy(entry.from_path, entry.to_path)))
+            except ApiError as e:
+                results.append(RelocationBatchResultEntry.failure(RelocationBatchErrorEntry.relocation_error(e.error)))
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self._copy_jobs[async_job_id] = RelocationBatchV2Result(entries=results)
+
+    def files_copy_batch_v2(self, entries, autorename=False):
+        self._call('files_copy_batch_v2')
+        with self._lock:
+            async_job_id = 'local_job:' + str(len(self._copy_jobs))
+            self._copy_jobs[async_job_id] = None
+        threading.Thread(target=self._run_copy_batch, args=(async_job_id, entries), daemon=True).start()
+        return RelocationBatchV2Launch.async_job_id(async_job_id)
+
+    def files_copy_batch_check_v2(self, async_job_id):
+        self._call('files_copy_batch_check_v2')
+        with self._lock:
+            result = self._copy_jobs[async_job_id]
+        if result is None:
+            return RelocationBatchV2JobStatus.in_progress
+        return RelocationBatchV2JobStatus.complete(result)
+
+    # -------------------------------------------------------------------------------------------------
+    # upload
+
+    def _write(self, data, path, error):
+        local_path = self._local_path(path)
+        if os.path.exists(local_path):
+            raise self._error(error)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(local_path, 'wb') as f:
+            f.write(data)
+        return self._metadata(path)
+
+    def files_upload(self, f, path, **kwargs):
+        self._call('files_upload')
+        self._transfer(len(f), 'bytes_uploaded')
+        conflict = UploadError.path(UploadWriteFailed(reason=WriteError.conflict(WriteConflictError.file), upload_session_id=''))
+        return self._write(f, path, conflict)
+
+    def files_upload_session_start(self, f, **kwargs):
+        self._call('files_upload_session_start')
+        self._transfer(len(f), 'bytes_uploaded')
+        with self._lock:
+            session_id = 'local_session:' + str(len(self._upload_sessions))
+            self._upload_sessions[session_id] = bytearray(f)
+        return UploadSessionStartResult(session_id=session_id)
+
+    def _append(self, f, session_id, offset, error_type):
+        if session_id not in self._upload_sessions:
+            raise self._error(error_type.lookup_failed(UploadSessionLookupError.not_found))
+        data = self._upload_sessions[session_id]
+        if offset != len(data):
+            raise self._error(error_type.lookup_failed(
+                UploadSessionLookupError.incorrect_offset(UploadSessionOffsetError(correct_offset=len(data)))))
+        self._transfer(len(f), 'bytes_uploaded')
+        data += f
+
+    def files_upload_session_append(self, f, session_id, offset):
+        self._call('files_upload_session_append')
+        self._append(f, session_id, offset, UploadSessionAppendError)
+
+    def files_upload_session_finish(self, f, cursor, commit, **kwargs):
+        self._call('files_upload_session_finish')
+        self._append(f, cursor.session_id, cursor.offset, UploadSessionFinishError)
+        data = self._upload_sessions.pop(cursor.session_id)
+        conflict = UploadSessionFinishError.path(WriteError.conflict(WriteConflictError.file))
+        return self._write(bytes(data), commit.path, conflict)
+
+    # -------------------------------------------------------------------------------------------------
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
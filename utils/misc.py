@@ -1,6 +1,16 @@
+import contextlib
 import json
 import os
 
+# expression dictionaries read by `get_path_info`, data_path -> (modification time, content, matchers, dir_path_infos)
+_path_info_data = {}
+
+# dictionaries already checked for modifications in the current batch, None outside of a batch (see `path_info_data_batch`)
+_path_info_data_checked = None
+
+# keys of the expression dictionaries searched in the paths (see `get_path_info`)
+PATH_INFO_SEARCH_KEYS = ["to_search_in_dirs", "to_search_in_filename", "to_search_at_end_of_filename"]
+
 def extract_extension(str):
     """
     Returns the extension of the filename / path string, dot included,
@@ -86,6 +96,228 @@ def pick_largest_str_in_list(str_list):
             res = s
     return res
 
+class ExpressionMatcher:
+    """
+    Aho-Corasick automaton finding which expressions of a list are contained in a string, in one pass over the string
+    (instead of one `in` test per expression)
+
+    Package
+    ----
+    `utils.misc.py`
+
+    Parameters
+    --------
+        expressions : list(str),
+            expressions to search, their order is used to break ties (see `best_match`)
+    """
+
+    def __init__(self, expressions):
+        self.expressions = list(expressions)
+        # trie of the expressions: goto[state][character] = next state, state 0 being the root
+        self.goto = [{}]
+        # indices of the expressions ending at each state (including the ones ending at its fail state)
+        self.outputs = [[]]
+        for idx, expression in enumerate(self.expressions):
+            if expression == '':
+                # never picked by `pick_largest_str_in_list`
+                continue
+            state = 0
+            for character in expression:
+                if character not in self.goto[state]:
+                    self.goto.append({})
+                    self.outputs.append([])
+                    self.goto[state][character] = len(self.goto) - 1
+                state = self.goto[state][character]
+            self.outputs[state].append(idx)
+
+        # fail[state] = state of the longest proper suffix of the state's string that is in the trie (breadth first)
+        self.fail = [0] * len(self.goto)
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for character, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail_state = self.fail[state]
+                while fail_state and character not in self.goto[fail_state]:
+                    fail_state = self.fail[fail_state]
+                self.fail[next_state] = self.goto[fail_state].get(character, 0)
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[self.fail[next_state]]
+
+        # transitions of the automaton, completed by `transition` as new characters are read
+        self.delta = [dict(transitions) for transitions in self.goto]
+
+    def find(self, text):
+        """
+        Returns the indices of the expressions contained in `text`
+
+        Parameters
+        --------
+            text : str,
+                string in which the expressions are searched
+
+        Returns
+        --------
+            found : set(int),
+                indices in `expressions` of the expressions found
+        """
+        delta, outputs = self.delta, self.outputs
+        found = set()
+        state = 0
+        for character in text:
+            try:
+                state = delta[state][character]
+            except KeyError:
+                state = self.transition(state, character)
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
+
+    def transition(self, state, character):
+        """
+        Returns the state reached from `state` when reading `character`, following the fail links if needed,
+        and keeps it in `delta` so that the fail links are followed only once per state and character
+        """
+        next_state = state
+        while next_state and character not in self.goto[next_state]:
+            next_state = self.fail[next_state]
+        next_state = self.goto[next_state].get(character, 0)
+        self.delta[state][character] = next_state
+        return next_state
+
+    def best_match(self, text, excluded=''):
+        """
+        Returns the longest expression contained in `text` and not contained in `excluded`, the first one in the list in case of a tie,
+        i.e. `pick_largest_str_in_list([e for e in expressions if e in text and e not in excluded])`
+
+        Parameters
+        --------
+            text : str,
+                string in which the expressions are searched
+            excluded : str, default: ''
+                expressions contained in this string are ignored
+
+        Returns
+        --------
+            expression : str,
+                the chosen expression, '' if none was found
+        """
+        res = ''
+        for idx in sorted(self.find(text)):
+            expression = self.expressions[idx]
+            if len(expression) > len(res) and expression not in excluded:
+                res = expression
+        return res
+
+def load_path_info_data(data_path):
+    """
+    Returns the content of the json in `data_path` (see `get_path_info`), read only once:
+    the json is read again only if it was modified since the last call
+
+    The lists of expressions are returned as tuples, since the content is shared by all the calls
+
+    Package
+    ----
+    `utils.misc.py`
+
+    Parameters
+    --------
+        data_path : str,
+            path to a json containing the strings to search in paths (e.g. 'utils/seg_info.json')
+
+    Returns
+    --------
+        data : dict,
+            data[key] = tuple(expressions) for each key of the json
+    """
+    return load_path_info_entry(data_path)[1]
+
+def load_path_info_entry(data_path):
+    """
+    Returns the cached (modification time, content, matchers, dir_path_infos) of the json in `data_path`,
+    reading it again if it was modified (see `load_path_info_data`),
+    matchers[key] being the `ExpressionMatcher` of data[key] for each key in `PATH_INFO_SEARCH_KEYS`,
+    and dir_path_infos the expressions already found in directories (see `get_dir_path_infos`)
+
+    Package
+    ----
+    `utils.misc.py`
+    """
+    cached = _path_info_data.get(data_path)
+    if _path_info_data_checked is not None and data_path in _path_info_data_checked and cached is not None:
+        return cached
+
+    mtime = os.stat(data_path).st_mtime_ns
+    if _path_info_data_checked is not None:
+        _path_info_data_checked.add(data_path)
+    if cached is None or cached[0] != mtime:
+        with open(data_path, 'r') as f:
+            data = json.load(f)
+        data = {key: tuple(expressions) for key, expressions in data.items()}
+        matchers = {key: ExpressionMatcher(data[key]) for key in PATH_INFO_SEARCH_KEYS}
+        cached = (mtime, data, matchers, {})
+        _path_info_data[data_path] = cached
+    return cached
+
+@contextlib.contextmanager
+def path_info_data_batch():
+    """
+    Within this block, each expression dictionary is checked for modifications (see `load_path_info_data`) only once,
+    instead of once per call of `get_path_info`: used to classify a batch of paths (see `utils.filename_reader.create_filename_dicts`)
+
+    Package
+    ----
+    `utils.misc.py`
+    """
+    global _path_info_data_checked
+    previous = _path_info_data_checked
+    if previous is None:
+        _path_info_data_checked = set()
+    try:
+        yield
+    finally:
+        _path_info_data_checked = previous
+
+def curate_path(path, strs_to_ignore):
+    """
+    Returns `path` in lowercase, with '_' instead of spaces and without the strings to ignore (see `get_path_info`)
+
+    Package
+    ----
+    `utils.misc.py`
+    """
+    curated_path = path.replace(' ', '_').lower()
+    for s in strs_to_ignore:
+        curated_path = curated_path.replace(s,'')
+    return curated_path
+
+def get_dir_path_infos(dir_path, data_path):
+    """
+    Returns the expressions from the json in `data_path` chosen in each directory of `dir_path` (see `get_path_info`),
+    computed once per directory: the files of a same directory share them, only their filename is searched again
+
+    Package
+    ----
+    `utils.misc.py`
+
+    Parameters
+    --------
+        dir_path : str,
+            curated path of the parent directory of a dropbox file (see `curate_path`)
+        data_path : str,
+            path to a json containing the strings to search in paths (e.g. 'utils/seg_info.json')
+
+    Returns
+    --------
+        path_infos : tuple(str),
+            chosen expression for each directory of `dir_path`, '' if none was found
+    """
+    _, _, matchers, dir_path_infos = load_path_info_entry(data_path)
+    if dir_path not in dir_path_infos:
+        path_infos = []
+        for dir in dir_path.split('/'):
+            path_infos.append(matchers["to_search_in_dirs"].best_match(dir, '_'.join(path_infos)))
+        dir_path_infos[dir_path] = tuple(path_infos)
+    return dir_path_infos[dir_path]
+
 def get_path_info(path, data_path, debug=False):
     """
     Returns the infos contained in `path` by searching matching expressions from the json in `data_path`
@@ -132,21 +364,15 @@ def get_path_info(path, data_path, debug=False):
         path_info, str
             path_info (e.g. func_info, seg_info, func_task, category)
     """
-    with open(data_path, 'r') as f:
-        data = json.load(f)
+    _, data, matchers, _ = load_path_info_entry(data_path)
 
-    curated_path = path.replace(' ', '_').lower()
-
-    strs_to_ignore = data["to_ignore"]
-
-    for s in strs_to_ignore:
-        curated_path = curated_path.replace(s,'')
+    curated_path = curate_path(path, data["to_ignore"])
     
     if debug:
         print('curated path', curated_path)
 
-    filename = remove_extension(curated_path.split('/')[-1])
-    dir_path = '/'.join(curated_path.split('/')[:-1])
+    dir_path, _, filename = curated_path.rpartition('/')
+    filename = remove_extension(filename)
     END_OF_FILENAME_LENGTH = 8
     if len(filename.split('_'))>END_OF_FILENAME_LENGTH:
         end_of_filename = '_'.join(filename.split('_')[-END_OF_FILENAME_LENGTH:])
@@ -157,60 +383,28 @@ def get_path_info(path, data_path, debug=False):
         print('curated filename: ', filename)
         print('curated eof', end_of_filename)
     
-    expressions_to_search_in_dirs = data["to_search_in_dirs"]
-    expressions_to_search_in_filename = data["to_search_in_filename"]
-    expressions_to_search_at_end_of_filename = data["to_search_at_end_of_filename"]
-    
-    path_infos = []
-
-    for dir in dir_path.split('/'):
-
-        dir_expressions = [dir_expression 
-                           for dir_expression in expressions_to_search_in_dirs 
-                           if dir_expression in dir and (dir_expression not in '_'.join(path_infos))]
-        if debug:
-            print('dir expressions: ',dir_expressions)
-        chosen_dir_expression = pick_largest_str_in_list(dir_expressions)
-        path_infos.append(chosen_dir_expression)
-        filename.replace(chosen_dir_expression, '')
-        end_of_filename.replace(chosen_dir_expression, '')
-    
+    # the expressions chosen in the directories are shared by the files of a same directory (see `get_dir_path_infos`),
+    # the expressions contained in each part of the path are found by the matchers in one pass (see `ExpressionMatcher`),
+    # the expressions already contained in the infos found in the previous parts are ignored
+    path_infos = list(get_dir_path_infos(dir_path, data_path))
+    if debug:
+        for dir in dir_path.split('/'):
+            print('dir expressions: ', [matchers["to_search_in_dirs"].expressions[idx] for idx in sorted(matchers["to_search_in_dirs"].find(dir))])
 
-    filename_expressions = [filename_expression 
-                            for filename_expression in expressions_to_search_in_filename 
-                            if filename_expression in filename and (filename_expression not in '_'.join(path_infos))]
-    chosen_filename_expression = pick_largest_str_in_list(filename_expressions)
+    chosen_filename_expression = matchers["to_search_in_filename"].best_match(filename, '_'.join(path_infos))
     if debug:
-        print('filename expressions: ',filename_expressions)
+        print('filename expressions: ', [matchers["to_search_in_filename"].expressions[idx] for idx in sorted(matchers["to_search_in_filename"].find(filename))])
     path_infos.append(chosen_filename_expression)
-    filename.replace(chosen_filename_expression, '')
-    end_of_filename.replace(chosen_filename_expression, '')
 
-    end_of_filename_expressions = [filename_expression 
-                            for filename_expression in expressions_to_search_at_end_of_filename 
-                            if filename_expression in end_of_filename and (filename_expression not in '_'.join(path_infos))]
-    path_infos.append(pick_largest_str_in_list(end_of_filename_expressions))
+    path_infos.append(matchers["to_search_at_end_of_filename"].best_match(end_of_filename, '_'.join(path_infos)))
     if debug:
-        print('end_of_filename expressions: ',end_of_filename_expressions)
+        print('end_of_filename expressions: ', [matchers["to_search_at_end_of_filename"].expressions[idx] for idx in sorted(matchers["to_search_at_end_of_filename"].find(end_of_filename))])
 
     path_info = '_'.join([elt.strip('_') for elt in path_infos if elt !=''])
     path_info = path_info.replace('__','_')
     path_info = path_info.strip('_')
     return path_info
 
-def clean_up_tmpdir(debug=False):
-    """
-    Removes any file in `tmp_dir/`
-
-    Package
-    ----
-    `utils.misc.py`
-    """
-    for file in os.listdir('tmp_dir/'):
-        if debug:
-            print(file)
-        os.remove('tmp_dir/' + file)
-
 def my_ls(dir, force_abspath=False):
     """
     Lists complete paths (files or subdirs) under `dir`
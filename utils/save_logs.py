@@ -3,11 +3,12 @@ import os
 
 from tqdm import tqdm
 
-from utils.filename_reader import create_filename_dict, generate_new_path
-from utils.globals import STRS_TO_REMOVE_FOR_JSONS_TO_DATA
+from utils.classification_cache import ClassificationCache, get_inputs_key, get_rules_fingerprint
+from utils.filename_reader import create_filename_dicts, generate_new_path
+from utils.globals import CLASSIFICATION_CACHE_PATH, STRS_TO_REMOVE_FOR_JSONS_TO_DATA
 from utils.misc import remove_extension
 
-def save_file_list(input_files, file_list_path):
+def save_file_list(input_files, file_list_path, cursor=None, file_metadata=None):
     """
     Saves a json in `file_list_path` containing all files in the source directory in the dropbox
 
@@ -21,16 +22,27 @@ def save_file_list(input_files, file_list_path):
             a list of path strings
         file_list_path : str,
             the path where the file list will be saved (usually of the type `/file_list/subdir/file_list-[n].json`)
+        cursor=None : str,
+            Dropbox cursor of the listing, used to read only the changes in the next listing (see `utils.dropbox_filesystem.update_file_list`)
+        file_metadata=None : dict,
+            metadata of the listed entries: file_metadata[path] = {"kind": ..., "size": ..., "content_hash": ..., "rev": ..., "server_modified": ...}
+            (see `utils.dropbox_filesystem.entry_metadata`)
     
     Saves
     --------
         file_list_path, json file
-            the file list can be found as follows: input_files = file_list_path_dict['input_files']
+            the file list can be found as follows: input_files = file_list_path_dict['input_files'],
+            the cursor (if specified) in file_list_path_dict['cursor'],
+            and the file metadata (if specified) in file_list_path_dict['file_metadata']
     """
 
     data = {
         "input_files": input_files
     }
+    if cursor is not None:
+        data["cursor"] = cursor
+    if file_metadata is not None:
+        data["file_metadata"] = file_metadata
 
     try:
         dirs = '/'.join(file_list_path.split('/')[:-1])
@@ -49,8 +61,35 @@ def read_file_list(file_list_path):
     return input_files
 
 
+def read_file_metadata(file_list_path):
+    """
+    Returns the metadata saved with the file list in `file_list_path` (see `save_file_list`),
+    an empty dict if there is none (file list saved by an older version, or missing file)
+
+    Package
+    ----
+    `utils.save_logs.py`
+
+    Parameters
+    --------
+        file_list_path : str,
+            path to the saved file list (usually of the type `/file_list/subdir/file_list-[n].json`)
+
+    Returns
+    --------
+        file_metadata : dict,
+            file_metadata[path] = {"kind": ..., "size": ..., "content_hash": ..., "rev": ..., "server_modified": ...}
+    """
+    try:
+        with open(file_list_path, 'r') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    return data.get('file_metadata', {})
+
 
-def save_file_infos(input_files, participants_dict, file_infos_path, tmpfile_infos_path, **kwargs):
+
+def save_file_infos(input_files, participants_dict, file_infos_path, tmpfile_infos_path, workers=None, cache_path=CLASSIFICATION_CACHE_PATH, **kwargs):
     """
     Saves a json in `file_infos_path` containing information and sorting instructions ("new_path") for all files in `input_files`
 
@@ -70,6 +109,11 @@ def save_file_infos(input_files, participants_dict, file_infos_path, tmpfile_inf
             the path where the file infos will be saved (usually of the type `/file_infos/subdir/file_infos-[n].json`)
         tmpfile_infos_path : str,
             the path where the file infos (for temporary files) will be saved (usually of the type `/file_infos/subdir/tmp_file_infos-[n].json`)
+        workers : int, default=None,
+            number of processes classifying the files (the number of CPUs if None, see `utils.filename_reader.create_filename_dicts`)
+        cache_path : str, default=CLASSIFICATION_CACHE_PATH,
+            database of the file infos computed in the previous runs (see `utils.classification_cache.py`),
+            only the files not found in it (or classified with other rules) are classified. No cache is used if None
         **kwargs
     
     Saves
@@ -96,9 +140,23 @@ def save_file_infos(input_files, participants_dict, file_infos_path, tmpfile_inf
     """
     final_data= {}
     tmp_files_infos = {}
+    if cache_path is not None:
+        cache = ClassificationCache(cache_path)
+        fingerprint = get_rules_fingerprint(participants_dict, **kwargs)
+        inputs_key = get_inputs_key(participants_dict, **kwargs)
+        cached = cache.get_many(input_files, fingerprint)
+    else:
+        cached = {}
+
+    files_to_classify = [file for file in dict.fromkeys(input_files) if file not in cached]
+    classified = dict(zip(files_to_classify, create_filename_dicts(files_to_classify, participants_dict, workers=workers, **kwargs)))
+    if cache_path is not None:
+        cache.put_many(classified, fingerprint, inputs_key)
+        print(str(len(classified)) + ' files classified, ' + str(len(cached)) + ' read from ' + cache_path)
+
     for file in input_files:
         #print(file)
-        file_infos = create_filename_dict(file, participants_dict, **kwargs)
+        file_infos = cached[file] if file in cached else classified[file]
         is_tmp_bool = file_infos['is_tmp']
 
         if (not is_tmp_bool):
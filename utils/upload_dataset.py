@@ -4,7 +4,8 @@ import os
 import re
 from tqdm import tqdm
 
-from utils.globals import STOP_FLAGS_UPLOAD, EXACT_STOP_FLAGS_UPLOAD, TO_UPLOAD_REGEXPS
+from utils.dropbox_client import get_dropbox_client
+from utils.globals import DROPBOX_TRANSFER_TIMEOUT, STOP_FLAGS_UPLOAD, EXACT_STOP_FLAGS_UPLOAD, TO_UPLOAD_REGEXPS
 from utils.misc import my_ls
 
 """
@@ -16,7 +17,7 @@ def upload(
     access_token,
     file_path,
     target_path,
-    timeout=900,
+    timeout=DROPBOX_TRANSFER_TIMEOUT,
     chunk_size=4 * 1024 * 1024,
 ):
     """
@@ -49,7 +50,8 @@ def upload(
     # Source - https://stackoverflow.com/a
     # Posted by Greg, modified by community. See post 'Timeline' for change history
     # Retrieved 2026-01-26, License - CC BY-SA 4.0
-    dbx = dropbox.Dropbox(access_token, timeout=timeout)
+    # shared client: the token is validated once, and the connections are reused from one file to the next
+    dbx = get_dropbox_client(access_token, verbose=False, timeout=timeout)
     with open(file_path, "rb") as f:
         file_size = os.path.getsize(file_path)
         if file_size <= chunk_size: